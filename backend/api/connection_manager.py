@@ -0,0 +1,158 @@
+import asyncio
+import json
+import uuid
+from typing import Dict, Optional
+
+from fastapi import WebSocket
+
+from utils.redis_client import RedisClient
+from utils.metrics import WS_CONNECTIONS, WS_QUEUE_DEPTH
+
+class ClientConnection:
+    """One WebSocket with its own bounded send queue, drained by a dedicated task"""
+
+    def __init__(self, manager: "ConnectionManager", websocket: WebSocket):
+        self.manager = manager
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=manager.max_queue)
+        self.dropped = 0
+        self.task = asyncio.create_task(self._sender())
+
+    def offer(self, text: str) -> bool:
+        """Queue a message without waiting; False means the client is too slow to keep"""
+        try:
+            self.queue.put_nowait(text)
+            return True
+        except asyncio.QueueFull:
+            if self.manager.slow_policy != "drop_oldest":
+                return False
+            self.queue.get_nowait()
+            self.queue.put_nowait(text)
+            self.dropped += 1
+            self.manager.dropped += 1
+            return True
+
+    async def _sender(self):
+        try:
+            while True:
+                text = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(text), self.manager.send_timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Dead or stalled socket: stop tracking it
+            self.manager.remove(self.websocket)
+
+class ConnectionManager:
+    """Fan-out of alerts to WebSocket clients, relayed between workers over Redis pub/sub.
+
+    Each message is serialized once and offered to every client's bounded
+    queue, so one slow browser never delays the others. A client whose queue
+    is full either loses its oldest message (``drop_oldest``) or is
+    disconnected (``disconnect``).
+    """
+
+    def __init__(self, max_queue: int = 100, slow_policy: str = "drop_oldest", send_timeout: float = 5.0):
+        self.max_queue = max_queue
+        self.slow_policy = slow_policy
+        self.send_timeout = send_timeout
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+
+        self.worker_id = uuid.uuid4().hex
+        self.redis: Optional[RedisClient] = None
+        self.channel = "fraud_alerts"
+        self._relay_task: Optional[asyncio.Task] = None
+
+        self.dropped = 0
+        self.slow_disconnects = 0
+        self.relay_errors = 0
+
+    @property
+    def active_connections(self):
+        return list(self.connections)
+
+    async def connect(self, websocket: WebSocket):
+        await websocket.accept()
+        self.connections[websocket] = ClientConnection(self, websocket)
+        WS_CONNECTIONS.inc()
+
+    def disconnect(self, websocket: WebSocket):
+        connection = self.remove(websocket)
+        if connection is not None:
+            connection.task.cancel()
+
+    def remove(self, websocket: WebSocket) -> Optional[ClientConnection]:
+        connection = self.connections.pop(websocket, None)
+        if connection is not None:
+            WS_CONNECTIONS.dec()
+        return connection
+
+    async def broadcast(self, message: dict):
+        """Deliver to this worker's clients and publish for the other workers"""
+        text = json.dumps(message, default=str)
+        self.broadcast_local(text)
+        if self.redis is not None:
+            try:
+                await self.redis.publish(self.channel, {"origin": self.worker_id, "payload": text})
+            except Exception:
+                self.relay_errors += 1
+
+    def broadcast_local(self, text: str):
+        queued = 0
+        for websocket, connection in list(self.connections.items()):
+            if not connection.offer(text):
+                self.slow_disconnects += 1
+                self.disconnect(websocket)
+                asyncio.create_task(self._close(websocket))
+            else:
+                queued += connection.queue.qsize()
+        WS_QUEUE_DEPTH.set(queued)
+
+    async def _close(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)
+        except Exception:
+            pass
+
+    async def start_relay(self, redis_client: RedisClient, channel: str = "fraud_alerts"):
+        self.redis = redis_client
+        self.channel = channel
+        self._relay_task = asyncio.create_task(self._relay())
+
+    async def stop_relay(self):
+        if self._relay_task is not None:
+            self._relay_task.cancel()
+            try:
+                await self._relay_task
+            except asyncio.CancelledError:
+                pass
+            self._relay_task = None
+
+    async def _relay(self):
+        """Forward alerts published by other workers to local clients, resubscribing on errors"""
+        while True:
+            try:
+                pubsub = await self.redis.subscribe(self.channel)
+                try:
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        envelope = json.loads(message["data"])
+                        if envelope.get("origin") != self.worker_id:
+                            self.broadcast_local(envelope["payload"])
+                finally:
+                    await pubsub.aclose()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.relay_errors += 1
+                await asyncio.sleep(1.0)
+
+    def stats(self) -> Dict:
+        return {
+            "connections": len(self.connections),
+            "queued_messages": sum(c.queue.qsize() for c in self.connections.values()),
+            "dropped_messages": self.dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "relay_errors": self.relay_errors
+        }
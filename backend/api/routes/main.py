@@ -1,41 +1,133 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
-from typing import List
 import asyncio
+import logging
+import os
 import uuid
 from datetime import datetime
 
-from database.connection import init_db
+from database.connection import init_db, engine
+from database.writer import WriteBehindQueue
+from database.rollups import rollups, rebuild_rollups
+from database.partitions import run_maintenance
 from utils.redis_client import RedisClient
+from utils.cache import ResponseCache
+from utils.idempotency import IdempotencyStore
+from utils.metrics import render_metrics
+from features.state import RedisFeatureState
+from features.graph import EntityGraph
+from features.snapshot import save_state, warm_start
+from api.connection_manager import ConnectionManager
+from ml_models.batcher import MicroBatcher
 from api.routes.routes import transactions, analytics
 
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
+logger = logging.getLogger(__name__)
 
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
+manager = ConnectionManager(
+    max_queue=int(os.getenv("WS_QUEUE_SIZE", "100")),
+    slow_policy=os.getenv("WS_SLOW_CONSUMER_POLICY", "drop_oldest")
+)
+
+GRAPH_SNAPSHOT_PATH = os.getenv("GRAPH_SNAPSHOT_PATH")
+GRAPH_SNAPSHOT_INTERVAL = float(os.getenv("GRAPH_SNAPSHOT_INTERVAL", "300"))
 
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
+async def snapshot_graph_periodically():
+    while True:
+        await asyncio.sleep(GRAPH_SNAPSHOT_INTERVAL)
+        # Copy on the event loop so scoring cannot mutate the graph mid-copy; write from a thread
+        arrays = transactions.feature_engine.graph.to_arrays()
+        try:
+            await asyncio.to_thread(EntityGraph.write, GRAPH_SNAPSHOT_PATH, arrays)
+        except OSError:
+            logger.exception("Graph snapshot failed")
 
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except:
-                pass
+FEATURE_SNAPSHOT_PATH = os.getenv("FEATURE_SNAPSHOT_PATH")
+FEATURE_SNAPSHOT_INTERVAL = float(os.getenv("FEATURE_SNAPSHOT_INTERVAL", "60"))
 
-manager = ConnectionManager()
+async def snapshot_features_periodically():
+    while True:
+        await asyncio.sleep(FEATURE_SNAPSHOT_INTERVAL)
+        try:
+            await save_state(transactions.feature_engine, FEATURE_SNAPSHOT_PATH)
+        except OSError:
+            logger.exception("Feature snapshot failed")
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     await init_db()
+    async with engine.begin() as conn:
+        # Seed the dashboard rollups from existing data on first start
+        await rebuild_rollups(conn, only_if_empty=True)
+    await rollups.start(engine)
+    partition_task = None
+    if engine.dialect.name == "postgresql":
+        # Keeps future partitions in place and applies retention (RETENTION_DAYS)
+        partition_task = asyncio.create_task(run_maintenance(engine))
+    # Models are loaded once here; later manifest changes are picked up by the watcher
+    await transactions.registry.start()
     app.state.redis = RedisClient()
     await app.state.redis.connect()
+    app.state.cache = ResponseCache(
+        app.state.redis,
+        l1_ttl=float(os.getenv("CACHE_L1_TTL", "1.0")),
+        l2_ttl=int(os.getenv("CACHE_L2_TTL", "5"))
+    )
+    app.state.idempotency = IdempotencyStore(
+        app.state.redis,
+        ttl=int(os.getenv("IDEMPOTENCY_TTL", "86400")),
+        lock_ttl=int(os.getenv("IDEMPOTENCY_LOCK_TTL", "30"))
+    )
+    app.state.feature_state = None
+    if os.getenv("FEATURE_STATE_BACKEND", "local") == "redis":
+        app.state.feature_state = RedisFeatureState(app.state.redis, windows=transactions.feature_engine.windows)
+    feature_task = None
+    app.state.warm_start = None
+    if FEATURE_SNAPSHOT_PATH and app.state.feature_state is None:
+        # Warm velocity counters from the last snapshot plus anything stored since
+        app.state.warm_start = await warm_start(engine, transactions.feature_engine, FEATURE_SNAPSHOT_PATH)
+        feature_task = asyncio.create_task(snapshot_features_periodically())
+    app.state.batcher = None
+    if os.getenv("SCORE_BATCHING", "off") == "on":
+        app.state.batcher = MicroBatcher(
+            transactions.score_pending,
+            max_batch=int(os.getenv("SCORE_BATCH_MAX_SIZE", "64")),
+            max_wait=float(os.getenv("SCORE_BATCH_MAX_WAIT_MS", "2")) / 1000,
+            latency_slo=float(os.getenv("SCORE_LATENCY_SLO_MS", "10")) / 1000
+        )
+    app.state.writer = None
+    if os.getenv("PERSISTENCE_MODE", "sync") == "write_behind":
+        app.state.writer = WriteBehindQueue(
+            engine,
+            max_size=int(os.getenv("WRITE_BEHIND_MAX_SIZE", "10000")),
+            batch_size=int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "500")),
+            max_age=float(os.getenv("WRITE_BEHIND_MAX_AGE_MS", "50")) / 1000,
+            dead_letter_path=os.getenv("WRITE_BEHIND_DEAD_LETTER_PATH")
+        )
+        await app.state.writer.start()
+    graph_task = None
+    if GRAPH_SNAPSHOT_PATH:
+        if os.path.exists(GRAPH_SNAPSHOT_PATH):
+            transactions.feature_engine.graph = EntityGraph.load(
+                GRAPH_SNAPSHOT_PATH, max_nodes=transactions.feature_engine.graph.max_nodes
+            )
+        graph_task = asyncio.create_task(snapshot_graph_periodically())
+    await manager.start_relay(app.state.redis)
     yield
+    await manager.stop_relay()
+    if graph_task:
+        graph_task.cancel()
+        transactions.feature_engine.graph.snapshot(GRAPH_SNAPSHOT_PATH)
+    if app.state.writer:
+        await app.state.writer.stop()
+    if feature_task:
+        feature_task.cancel()
+        await save_state(transactions.feature_engine, FEATURE_SNAPSHOT_PATH)
+    await rollups.stop()
+    if partition_task:
+        partition_task.cancel()
+    transactions.executor.shutdown()
+    await transactions.registry.stop()
     await app.state.redis.close()
 
 app = FastAPI(
@@ -50,6 +142,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Idempotent-Replayed"],
 )
 
 app.include_router(transactions.router, prefix="/api/v1/transactions", tags=["Transactions"])
@@ -61,7 +154,26 @@ async def root():
 
 @app.get("/api/v1/health")
 async def health():
-    return {"status": "healthy", "timestamp": datetime.utcnow().isoformat()}
+    writer = app.state.writer
+    batcher = app.state.batcher
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow().isoformat(),
+        "persistence": writer.stats() if writer else {"mode": "sync"},
+        "cache": app.state.cache.stats(),
+        "idempotency": app.state.idempotency.stats(),
+        "batching": batcher.stats() if batcher else {"enabled": False},
+        "scoring": transactions.executor.stats(),
+        "models": transactions.registry.stats(),
+        "rules": transactions.rules.stats(),
+        "warm_start": app.state.warm_start,
+        "websocket": manager.stats()
+    }
+
+@app.get("/metrics")
+async def metrics():
+    data, content_type = render_metrics()
+    return Response(content=data, media_type=content_type)
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
@@ -71,6 +183,8 @@ async def websocket_endpoint(websocket: WebSocket):
             await websocket.receive_text()
             await asyncio.sleep(1)
     except WebSocketDisconnect:
+        pass
+    finally:
         manager.disconnect(websocket)
 
 app.state.ws_manager = manager
\ No newline at end of file
@@ -1,124 +1,117 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, cast, Integer
+from sqlalchemy import select, update, func, cast, Integer
 from datetime import datetime, timedelta
+from typing import List, Optional
+import importlib.util
 
 from database.models import Transaction, Alert
-from database.connection import get_db
+from database.connection import get_db, engine
+from database.rollups import rollups, read_dashboard, read_trends
+from database.pagination import keyset_page, split_page
+from database.export import FORMATS, export
 
 router = APIRouter()
 
 @router.get("/dashboard")
-async def get_dashboard_stats(db: AsyncSession = Depends(get_db)):
-    # Total transactions
-    total_result = await db.execute(select(func.count(Transaction.id)))
-    total_transactions = total_result.scalar() or 0
-    
-    # Fraud count
-    fraud_result = await db.execute(
-        select(func.count(Transaction.id)).where(Transaction.is_fraud == True)
-    )
-    fraud_count = fraud_result.scalar() or 0
-    
-    # Risk distribution
-    risk_dist_result = await db.execute(
-        select(Transaction.risk_level, func.count(Transaction.id))
-        .group_by(Transaction.risk_level)
-    )
-    risk_distribution = {row[0]: row[1] for row in risk_dist_result}
-    
-    # Decision distribution
-    decision_result = await db.execute(
-        select(Transaction.decision, func.count(Transaction.id))
-        .group_by(Transaction.decision)
-    )
-    decision_distribution = {row[0]: row[1] for row in decision_result}
-    
-    # Average risk score
-    avg_score_result = await db.execute(select(func.avg(Transaction.risk_score)))
-    avg_risk_score = float(avg_score_result.scalar() or 0)
-    
-    # Total amount processed
-    amount_result = await db.execute(select(func.sum(Transaction.amount)))
-    total_amount = float(amount_result.scalar() or 0)
-    
-    # Unresolved alerts
-    alert_result = await db.execute(
-        select(func.count(Alert.id)).where(Alert.resolved == False)
-    )
-    unresolved_alerts = alert_result.scalar() or 0
-    
-    return {
-        "total_transactions": total_transactions,
-        "fraud_detected": fraud_count,
-        "fraud_rate": fraud_count / total_transactions if total_transactions > 0 else 0,
-        "average_risk_score": avg_risk_score,
-        "total_amount_processed": total_amount,
-        "risk_distribution": risk_distribution,
-        "decision_distribution": decision_distribution,
-        "unresolved_alerts": unresolved_alerts
-    }
+async def get_dashboard_stats(request: Request, db: AsyncSession = Depends(get_db)):
+    # Served from incrementally maintained rollups; see database/rollups.py
+    return await request.app.state.cache.get_or_compute("dashboard", lambda: read_dashboard(db))
 
 @router.get("/trends")
-async def get_trends(days: int = 7, db: AsyncSession = Depends(get_db)):
-    """Get transaction trends - returns data for each day"""
-    
-    # Get all transactions
-    result = await db.execute(
-        select(Transaction)
-        .order_by(Transaction.created_at)
+async def get_trends(request: Request, days: int = 7, granularity: str = "day", db: AsyncSession = Depends(get_db)):
+    """Get transaction trends for the last `days` days, per day or per hour"""
+    if granularity not in ("day", "hour"):
+        raise HTTPException(status_code=400, detail="granularity must be 'day' or 'hour'")
+    if days < 1:
+        raise HTTPException(status_code=400, detail="days must be at least 1")
+    
+    now = datetime.utcnow()
+    if granularity == "day":
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days - 1)
+    else:
+        start = now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=days * 24 - 1)
+    
+    return await request.app.state.cache.get_or_compute(
+        f"trends:{granularity}:{start.isoformat()}",
+        lambda: read_trends(db, start, granularity)
     )
-    transactions = result.scalars().all()
-    
-    if not transactions:
-        # Return empty trend data if no transactions
-        return []
-    
-    # Group by date
-    from collections import defaultdict
-    daily_data = defaultdict(lambda: {'total': 0, 'fraud': 0, 'risk_sum': 0.0})
-    
-    for txn in transactions:
-        date_key = txn.created_at.date().isoformat()
-        daily_data[date_key]['total'] += 1
-        if txn.is_fraud:
-            daily_data[date_key]['fraud'] += 1
-        daily_data[date_key]['risk_sum'] += txn.risk_score
-    
-    # Convert to list format
-    trends = []
-    for date_str in sorted(daily_data.keys()):
-        data = daily_data[date_str]
-        trends.append({
-            "date": date_str,
-            "total": data['total'],
-            "fraud": data['fraud'],
-            "average_risk": data['risk_sum'] / data['total'] if data['total'] > 0 else 0
-        })
-    
-    # Return last 'days' worth of data
-    return trends[-days:] if len(trends) > days else trends
 
 @router.get("/alerts")
 async def get_alerts(
+    request: Request,
+    response: Response,
     resolved: bool = None,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    query = select(Alert).order_by(Alert.created_at.desc()).limit(limit)
-    
-    if resolved is not None:
-        query = query.where(Alert.resolved == resolved)
-    
-    result = await db.execute(query)
-    alerts = result.scalars().all()
-    
-    return [{
-        "id": a.id,
-        "transaction_id": a.transaction_id,
-        "alert_type": a.alert_type,
-        "severity": a.severity,
-        "message": a.message,
-        "resolved": a.resolved,
-        "created_at": a.created_at.isoformat()
-    } for a in alerts]
\ No newline at end of file
+    """Newest alerts first; pass the X-Next-Cursor response header back as `cursor` for the next page"""
+    async def compute():
+        query = select(
+            Alert.id, Alert.transaction_id, Alert.alert_type, Alert.severity,
+            Alert.message, Alert.resolved, Alert.created_at
+        )
+        
+        if resolved is not None:
+            query = query.where(Alert.resolved == resolved)
+        
+        query = keyset_page(query, Alert.created_at, Alert.id, cursor, limit)
+        alerts, next_cursor = split_page((await db.execute(query)).all(), limit)
+        
+        return {"items": [{
+            "id": a.id,
+            "transaction_id": a.transaction_id,
+            "alert_type": a.alert_type,
+            "severity": a.severity,
+            "message": a.message,
+            "resolved": a.resolved,
+            "created_at": a.created_at.isoformat()
+        } for a in alerts], "next_cursor": next_cursor}
+    
+    page = await request.app.state.cache.get_or_compute(f"alerts:{resolved}:{limit}:{cursor}", compute)
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["items"]
+
+@router.post("/alerts/{alert_id}/resolve")
+async def resolve_alert(alert_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    result = await db.execute(
+        update(Alert)
+        .where(Alert.id == alert_id, Alert.resolved == False)
+        .values(resolved=True)
+        .returning(Alert.severity)
+    )
+    severity = result.scalar_one_or_none()
+    if severity is None:
+        exists = await db.execute(select(Alert.id).where(Alert.id == alert_id))
+        if exists.scalar_one_or_none() is None:
+            raise HTTPException(status_code=404, detail="Alert not found")
+        return {"id": alert_id, "resolved": True}
+    
+    await db.commit()
+    rollups.record_resolved(severity)
+    request.app.state.cache.invalidate()
+    return {"id": alert_id, "resolved": True}
+
+@router.get("/export")
+async def export_transactions(
+    format: str = "csv",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    decision: Optional[List[str]] = Query(None),
+    chunk_size: int = Query(10_000, ge=100, le=100_000)
+):
+    """Stream scored transactions as CSV, Parquet or Arrow; filters on created_at range and decision"""
+    if format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(FORMATS)}")
+    if format != "csv" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=501, detail=f"{format} export requires pyarrow")
+    
+    media_type, extension = FORMATS[format]
+    return StreamingResponse(
+        export(engine, format, chunk_size, start=start, end=end, decisions=decision),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions.{extension}"'}
+    )
@@ -1,157 +1,282 @@
-from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request
-from pydantic import BaseModel, Field
+from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks, Request, Response, Query, Header
+from fastapi.encoders import jsonable_encoder
 from typing import List, Optional, Dict
+from contextlib import contextmanager
 from datetime import datetime
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 import uuid
+import os
 
-from database.models import Transaction, Alert
+from database.models import Transaction
 from database.connection import get_db
-from ml_models.ensemble_scorer import EnsembleScorer
-from features.transaction_features import TransactionFeatureEngine
+from database.writer import insert_scored
+from database.rollups import rollups
+from database.pagination import keyset_page, split_page
+from ml_models.registry import ModelRegistry
+from ml_models.executor import ScoringExecutor, ScoringOverloaded
+from ml_models.rules import rules
+from features.transaction_features import TransactionFeatureEngine, HIGH_RISK_COUNTRIES
+from utils.metrics import STAGES
+from utils.idempotency import IdempotencyConflict, IdempotencyInProgress
+from api.schemas import TransactionRequest, TransactionResponse, build_records
 
 router = APIRouter()
-scorer = EnsembleScorer()
-feature_engine = TransactionFeatureEngine()
-
-class TransactionRequest(BaseModel):
-    user_id: str
-    merchant_id: str
-    amount: float = Field(..., gt=0)
-    currency: str = "USD"
-    country: str
-    device_id: str
-    ip_address: str
-    transaction_type: str
-    channel: str
-
-class TransactionResponse(BaseModel):
-    transaction_id: str
-    risk_score: float
-    risk_level: str
-    is_fraud: bool
-    fraud_probability: float
-    decision: str
-    reasons: List[str]
-    model_scores: Dict[str, float]
-    timestamp: datetime
-
-def get_risk_level(score: float) -> str:
-    if score >= 0.8: return "CRITICAL"
-    elif score >= 0.6: return "HIGH"
-    elif score >= 0.4: return "MEDIUM"
-    elif score >= 0.2: return "LOW"
-    return "MINIMAL"
-
-def get_decision(score: float) -> str:
-    if score >= 0.8: return "BLOCK"
-    elif score >= 0.6: return "REVIEW"
-    return "APPROVE"
+registry = ModelRegistry(os.getenv("MODEL_DIR"), poll_interval=float(os.getenv("MODEL_POLL_INTERVAL", "10")))
+feature_engine = TransactionFeatureEngine(
+    max_keys=int(os.getenv("FEATURE_MAX_KEYS", "10000000")) or None,
+    high_risk_countries=rules.rules.lists.get('high_risk_countries', HIGH_RISK_COUNTRIES),
+    graph_max_nodes=int(os.getenv("GRAPH_MAX_NODES", "5000000")) or None
+)
+# A reloaded rules file also replaces the country list behind the high_risk_country feature
+rules.listeners.append(lambda ruleset: setattr(
+    feature_engine, 'high_risk_countries',
+    frozenset(ruleset.lists.get('high_risk_countries', HIGH_RISK_COUNTRIES))
+))
+executor = ScoringExecutor(
+    registry,
+    mode=os.getenv("SCORING_EXECUTOR", "inline"),
+    workers=int(os.getenv("SCORING_WORKERS", "0")) or None,
+    max_pending=int(os.getenv("SCORING_MAX_PENDING", "256")),
+    model_timeout=float(os.getenv("SCORING_MODEL_TIMEOUT_MS", "50")) / 1000,
+    allow_partial=os.getenv("SCORING_ALLOW_PARTIAL", "off") == "on"
+)
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+
+async def predict(features) -> List[Dict]:
+    """Score a feature matrix on the configured executor; 503 when it is saturated"""
+    try:
+        return await executor.predict_batch(features)
+    except ScoringOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+async def score_pending(items: List[tuple]) -> List[Dict]:
+    """One feature + scoring pass over a micro-batch of (transaction, velocity) pairs"""
+    with STAGES['features'].time():
+        features = feature_engine.extract_features_batch([t for t, _ in items], velocities=[v for _, v in items])
+    with STAGES['model'].time():
+        return await predict(features)
+
+async def observe_velocity(request: Request, reqs: List[TransactionRequest]):
+    """Shared velocity counts from the Redis feature state, or None to use local counters"""
+    feature_state = getattr(request.app.state, 'feature_state', None)
+    if feature_state is None:
+        return None
+    try:
+        with STAGES['velocity'].time():
+            return await feature_state.observe_many([(req.user_id, req.device_id) for req in reqs])
+    except Exception:
+        # Redis unavailable: degrade to per-worker counters rather than failing the request
+        return None
+
+async def persist(request: Request, db: AsyncSession, transaction_rows: List[Dict], alert_rows: List[Optional[Dict]]):
+    """Write scored rows inline, or hand them to the write-behind queue when enabled"""
+    writer = getattr(request.app.state, 'writer', None)
+    with STAGES['persist'].time():
+        if writer is not None:
+            await writer.enqueue_many(transaction_rows, alert_rows)
+        else:
+            inserted = await insert_scored(db, transaction_rows, [a for a in alert_rows if a is not None])
+            await db.commit()
+            rollups.record(*inserted)
+    request.app.state.cache.invalidate()
 
 async def broadcast_alert(ws_manager, data: dict):
     if hasattr(ws_manager, 'broadcast'):
-        await ws_manager.broadcast({"type": "fraud_alert", "data": data})
+        with STAGES['broadcast'].time():
+            await ws_manager.broadcast({"type": "fraud_alert", "data": data})
+
+@contextmanager
+def idempotency_errors():
+    try:
+        yield
+    except IdempotencyConflict:
+        raise HTTPException(status_code=422, detail="Idempotency key reused with a different request body")
+    except IdempotencyInProgress:
+        raise HTTPException(status_code=409, detail="A request with this idempotency key is still in progress", headers={"Retry-After": "1"})
+
+async def run_idempotent(request: Request, response: Response, key: str, payload, compute):
+    """Run ``compute`` once per key; repeats get the stored JSON response back"""
+    with idempotency_errors():
+        result, replayed = await request.app.state.idempotency.run(key, payload, compute)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return result
+
+def alert_payload(transaction_row: Dict) -> Dict:
+    return {
+        "transaction_id": transaction_row['id'],
+        "user_id": transaction_row['user_id'],
+        "amount": transaction_row['amount'],
+        "risk_score": transaction_row['risk_score'],
+        "risk_level": transaction_row['risk_level']
+    }
 
 @router.post("/score", response_model=TransactionResponse)
 async def score_transaction(
     req: TransactionRequest,
     background_tasks: BackgroundTasks,
     request: Request,
-    db: AsyncSession = Depends(get_db)
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, max_length=255)
 ):
-    transaction_id = str(uuid.uuid4())
+    """Score one transaction; a repeated ``transaction_id`` or ``Idempotency-Key`` returns the original response"""
+    if req.transaction_id is None and idempotency_key is None:
+        return await score_one(req, background_tasks, request, db)
+    # The transaction id wins: it is also the stored row's primary key
+    key = f"txn:{req.transaction_id}" if req.transaction_id is not None else f"key:{idempotency_key}"
     
-    # Extract features
-    features = feature_engine.extract_features(req.dict())
+    async def compute():
+        return jsonable_encoder(await score_one(req, background_tasks, request, db))
+    return await run_idempotent(request, response, key, req.dict(), compute)
+
+async def score_one(req: TransactionRequest, background_tasks: BackgroundTasks, request: Request, db: AsyncSession):
+    transaction_id = req.transaction_id or str(uuid.uuid4())
     
-    # Get predictions
-    result = scorer.predict(features)
+    velocities = await observe_velocity(request, [req])
+    velocity = velocities[0] if velocities else None
     
-    risk_score = result['ensemble_score']
-    risk_level = get_risk_level(risk_score)
-    decision = get_decision(risk_score)
-    is_fraud = risk_score >= 0.6
+    batcher = getattr(request.app.state, 'batcher', None)
+    if batcher:
+        # Scored together with concurrent requests in one vectorized pass
+        with STAGES['batch'].time():
+            result = await batcher.submit((req.dict(), velocity))
+    else:
+        # Extract features
+        with STAGES['features'].time():
+            features = feature_engine.extract_features(req.dict(), velocity=velocity)
+        
+        # Get predictions
+        with STAGES['model'].time():
+            result = (await predict(features.reshape(1, -1)))[0]
     
-    # Save to database
-    db_transaction = Transaction(
-        id=transaction_id,
-        user_id=req.user_id,
-        merchant_id=req.merchant_id,
-        amount=req.amount,
-        currency=req.currency,
-        country=req.country,
-        device_id=req.device_id,
-        ip_address=req.ip_address,
-        transaction_type=req.transaction_type,
-        channel=req.channel,
-        risk_score=risk_score,
-        risk_level=risk_level,
-        is_fraud=is_fraud,
-        fraud_probability=result['fraud_probability'],
-        decision=decision,
-        model_scores=result['model_scores'],
-        reasons=result['reasons']
-    )
+    transaction_row, alert_row, response = build_records(req, transaction_id, result, datetime.utcnow())
+    feature_engine.record_outcome(transaction_row, response.is_fraud)
     
-    db.add(db_transaction)
-    await db.commit()
+    # Save transaction and alert (if high risk) to database
+    await persist(request, db, [transaction_row], [alert_row])
     
-    # Create alert if high risk
-    if risk_score >= 0.6:
-        alert = Alert(
-            transaction_id=transaction_id,
-            alert_type="HIGH_RISK_TRANSACTION",
-            severity=risk_level,
-            message=f"High risk transaction detected: ${req.amount}",
-            details=result
-        )
-        db.add(alert)
-        await db.commit()
-        
+    if alert_row:
         # Broadcast via WebSocket
-        alert_data = {
-            "transaction_id": transaction_id,
-            "user_id": req.user_id,
-            "amount": req.amount,
-            "risk_score": risk_score,
-            "risk_level": risk_level
-        }
-        background_tasks.add_task(broadcast_alert, request.app.state.ws_manager, alert_data)
+        background_tasks.add_task(broadcast_alert, request.app.state.ws_manager, alert_payload(transaction_row))
     
-    return TransactionResponse(
-        transaction_id=transaction_id,
-        risk_score=risk_score,
-        risk_level=risk_level,
-        is_fraud=is_fraud,
-        fraud_probability=result['fraud_probability'],
-        decision=decision,
-        reasons=result['reasons'],
-        model_scores=result['model_scores'],
-        timestamp=datetime.utcnow()
-    )
+    return response
+
+@router.post("/score/batch", response_model=List[TransactionResponse])
+async def score_transaction_batch(
+    reqs: List[TransactionRequest],
+    background_tasks: BackgroundTasks,
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(get_db),
+    idempotency_key: Optional[str] = Header(None, max_length=255)
+):
+    """Score N transactions in one pass and persist them with one bulk insert.
+
+    Items with a ``transaction_id`` already scored (here or through /score)
+    get their original response back instead of being scored again; an
+    ``Idempotency-Key`` header deduplicates the batch as a whole.
+    """
+    if not reqs:
+        return []
+    if len(reqs) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch size exceeds {MAX_BATCH_SIZE}")
+    ids = [req.transaction_id for req in reqs if req.transaction_id is not None]
+    if len(set(ids)) != len(ids):
+        raise HTTPException(status_code=422, detail="Duplicate transaction_id in batch")
+    if idempotency_key is None:
+        return await score_claimed(reqs, background_tasks, request, db)
+    
+    async def compute():
+        return jsonable_encoder(await score_claimed(reqs, background_tasks, request, db))
+    return await run_idempotent(request, response, f"batch:{idempotency_key}", [req.dict() for req in reqs], compute)
+
+async def score_claimed(reqs: List[TransactionRequest], background_tasks: BackgroundTasks, request: Request, db: AsyncSession):
+    """Score a batch, reserving client transaction ids first so replayed ones are not scored twice"""
+    keyed = [i for i, req in enumerate(reqs) if req.transaction_id is not None]
+    if not keyed:
+        return await score_many(reqs, background_tasks, request, db)
+    store = request.app.state.idempotency
+    with idempotency_errors():
+        stored = await store.claim_many([f"txn:{reqs[i].transaction_id}" for i in keyed], [reqs[i].dict() for i in keyed])
+    responses = [None] * len(reqs)
+    for i, result in zip(keyed, stored):
+        responses[i] = result
+    claimed = [i for i, result in zip(keyed, stored) if result is None]
+    fresh = [i for i, response in enumerate(responses) if response is None]
+    keys = [f"txn:{reqs[i].transaction_id}" for i in claimed]
+    try:
+        if fresh:
+            scored = await score_many([reqs[i] for i in fresh], background_tasks, request, db)
+            for i, response in zip(fresh, scored):
+                responses[i] = response
+    except BaseException:
+        await store.release_many(keys)
+        raise
+    await store.complete_many(keys, [jsonable_encoder(responses[i]) for i in claimed])
+    return responses
+
+async def score_many(reqs: List[TransactionRequest], background_tasks: BackgroundTasks, request: Request, db: AsyncSession):
+    # One feature matrix, one scoring pass
+    velocities = await observe_velocity(request, reqs)
+    with STAGES['features'].time():
+        features = feature_engine.extract_features_batch([req.dict() for req in reqs], velocities=velocities)
+    with STAGES['model'].time():
+        results = await predict(features)
+    
+    timestamp = datetime.utcnow()
+    transaction_rows, alert_rows, responses = [], [], []
+    for req, result in zip(reqs, results):
+        transaction_row, alert_row, response = build_records(req, req.transaction_id or str(uuid.uuid4()), result, timestamp)
+        feature_engine.record_outcome(transaction_row, response.is_fraud)
+        transaction_rows.append(transaction_row)
+        alert_rows.append(alert_row)
+        responses.append(response)
+    
+    # Bulk insert rows and alerts, single commit
+    await persist(request, db, transaction_rows, alert_rows)
+    
+    for transaction_row in transaction_rows:
+        if transaction_row['risk_score'] >= 0.6:
+            background_tasks.add_task(broadcast_alert, request.app.state.ws_manager, alert_payload(transaction_row))
+    
+    return responses
 
 @router.get("/recent")
 async def get_recent_transactions(
-    limit: int = 50,
+    request: Request,
+    response: Response,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
     db: AsyncSession = Depends(get_db)
 ):
-    result = await db.execute(
-        select(Transaction)
-        .order_by(Transaction.created_at.desc())
-        .limit(limit)
-    )
-    transactions = result.scalars().all()
+    """Newest transactions first; pass the X-Next-Cursor response header back as `cursor` for the next page"""
+    async def compute():
+        query = keyset_page(
+            select(
+                Transaction.id, Transaction.user_id, Transaction.amount, Transaction.risk_score,
+                Transaction.risk_level, Transaction.decision, Transaction.created_at
+            ),
+            Transaction.created_at, Transaction.id, cursor, limit
+        )
+        rows, next_cursor = split_page((await db.execute(query)).all(), limit)
+        
+        return {"items": [{
+            "id": t.id,
+            "user_id": t.user_id,
+            "amount": t.amount,
+            "risk_score": t.risk_score,
+            "risk_level": t.risk_level,
+            "decision": t.decision,
+            "created_at": t.created_at.isoformat()
+        } for t in rows], "next_cursor": next_cursor}
     
-    return [{
-        "id": t.id,
-        "user_id": t.user_id,
-        "amount": t.amount,
-        "risk_score": t.risk_score,
-        "risk_level": t.risk_level,
-        "decision": t.decision,
-        "created_at": t.created_at.isoformat()
-    } for t in transactions]
+    page = await request.app.state.cache.get_or_compute(f"recent:{limit}:{cursor}", compute)
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["items"]
 
 @router.get("/{transaction_id}")
 async def get_transaction(
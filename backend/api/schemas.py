@@ -0,0 +1,100 @@
+"""Request/response models and the mapping from ensemble output to stored rows.
+
+Kept free of database and web-app imports so the bulk loader and the
+offline benchmarks can use them without a configured database.
+"""
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pydantic import BaseModel, Field
+
+from utils.metrics import DECISIONS
+
+class TransactionRequest(BaseModel):
+    # Client-assigned id; retries with the same id are scored and stored only once
+    transaction_id: Optional[str] = Field(None, min_length=1, max_length=64)
+    user_id: str
+    merchant_id: str
+    amount: float = Field(..., gt=0)
+    currency: str = "USD"
+    country: str
+    device_id: str
+    ip_address: str
+    transaction_type: str
+    channel: str
+
+class TransactionResponse(BaseModel):
+    transaction_id: str
+    risk_score: float
+    risk_level: str
+    is_fraud: bool
+    fraud_probability: float
+    decision: str
+    reasons: List[str]
+    model_scores: Dict[str, float]
+    timestamp: datetime
+
+def get_risk_level(score: float) -> str:
+    if score >= 0.8: return "CRITICAL"
+    elif score >= 0.6: return "HIGH"
+    elif score >= 0.4: return "MEDIUM"
+    elif score >= 0.2: return "LOW"
+    return "MINIMAL"
+
+def get_decision(score: float) -> str:
+    if score >= 0.8: return "BLOCK"
+    elif score >= 0.6: return "REVIEW"
+    return "APPROVE"
+
+def build_records(req: TransactionRequest, transaction_id: str, result: Dict, timestamp: datetime):
+    """Build the transaction row, optional alert row and response for one scored request"""
+    risk_score = result['ensemble_score']
+    risk_level = get_risk_level(risk_score)
+    decision = get_decision(risk_score)
+    is_fraud = risk_score >= 0.6
+    DECISIONS.labels(decision, risk_level).inc()
+
+    transaction_row = dict(
+        id=transaction_id,
+        user_id=req.user_id,
+        merchant_id=req.merchant_id,
+        amount=req.amount,
+        currency=req.currency,
+        country=req.country,
+        device_id=req.device_id,
+        ip_address=req.ip_address,
+        transaction_type=req.transaction_type,
+        channel=req.channel,
+        risk_score=risk_score,
+        risk_level=risk_level,
+        is_fraud=is_fraud,
+        fraud_probability=result['fraud_probability'],
+        decision=decision,
+        model_scores=result['model_scores'],
+        reasons=result['reasons'],
+        created_at=timestamp
+    )
+
+    alert_row = None
+    if risk_score >= 0.6:
+        alert_row = dict(
+            transaction_id=transaction_id,
+            alert_type="HIGH_RISK_TRANSACTION",
+            severity=risk_level,
+            message=f"High risk transaction detected: ${req.amount}",
+            details=result,
+            created_at=timestamp
+        )
+
+    response = TransactionResponse(
+        transaction_id=transaction_id,
+        risk_score=risk_score,
+        risk_level=risk_level,
+        is_fraud=is_fraud,
+        fraud_probability=result['fraud_probability'],
+        decision=decision,
+        reasons=result['reasons'],
+        model_scores=result['model_scores'],
+        timestamp=timestamp
+    )
+    return transaction_row, alert_row, response
@@ -0,0 +1,176 @@
+"""Offline microbenchmarks for the scoring hot path.
+
+Measures ns per transaction and peak traced bytes per transaction for
+feature extraction, ensemble scoring, reason generation, risk/decision
+mapping and the Pydantic request/response round trip, at batch sizes 1, 100
+and 10k. Run from ``backend/``:
+
+    python -m benchmarks.scoring                 # print results
+    python -m benchmarks.scoring --update        # store as baseline.json
+    python -m benchmarks.scoring --check         # exit 1 if >20% slower than baseline
+
+Baselines are machine-specific; regenerate them on the machine that runs ``--check``.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict
+
+import numpy as np
+
+from features.transaction_features import TransactionFeatureEngine
+from ml_models.ensemble_scorer import EnsembleScorer
+from api.schemas import TransactionRequest, build_records, get_risk_level, get_decision
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+SIZES = (1, 100, 10_000)
+NOW = 1_700_000_000.0
+
+def make_transactions(n: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    return [{
+        "user_id": f"USER_{rng.randint(1000, 1500)}",
+        "merchant_id": f"MERCHANT_{rng.randint(100, 999)}",
+        "amount": round(rng.uniform(10, 10000), 2),
+        "currency": "USD",
+        "country": rng.choice(['US', 'UK', 'CA', 'NG', 'RU']),
+        "device_id": f"DEVICE_{rng.randint(1000, 3000)}",
+        "ip_address": f"192.168.{rng.randint(0, 255)}.{rng.randint(0, 255)}",
+        "transaction_type": rng.choice(['purchase', 'transfer', 'withdrawal']),
+        "channel": rng.choice(['web', 'mobile', 'pos'])
+    } for _ in range(n)]
+
+def make_cases(n: int) -> Dict[str, Callable[[], object]]:
+    """One zero-argument callable per benchmark, each processing ``n`` transactions"""
+    transactions = make_transactions(n)
+    engine = TransactionFeatureEngine()
+    features = TransactionFeatureEngine().extract_features_batch(transactions, now=NOW)
+    scorer = EnsembleScorer()
+    anomaly = scorer.score_matrix(features)[:, list(scorer.models).index('isolation_forest')]
+    scores = [float(s) for s in np.linspace(0, 1, n)]
+    results = scorer.predict_batch(features)
+    requests = [TransactionRequest(**t) for t in transactions]
+    req_time = datetime(2024, 1, 1)
+
+    def extract():
+        if n == 1:
+            return engine.extract_features(transactions[0], now=NOW)
+        return engine.extract_features_batch(transactions, now=NOW)
+
+    def predict():
+        if n == 1:
+            return scorer.predict(features[0])
+        return scorer.predict_batch(features)
+
+    def reasons():
+        return scorer._generate_reasons(features, anomaly)
+
+    def risk_decision():
+        return [(get_risk_level(s), get_decision(s)) for s in scores]
+
+    def pydantic_round_trip():
+        out = []
+        for transaction, req, result in zip(transactions, requests, results):
+            TransactionRequest.model_validate(transaction)
+            _, _, response = build_records(req, "bench", result, req_time)
+            out.append(response.model_dump_json())
+        return out
+
+    return {
+        "extract_features": extract,
+        "predict": predict,
+        "generate_reasons": reasons,
+        "risk_level_decision": risk_decision,
+        "pydantic_round_trip": pydantic_round_trip
+    }
+
+def measure(func: Callable[[], object], n: int, min_time: float, rounds: int) -> Dict[str, float]:
+    func()  # warm-up
+    loops = 1
+    while True:
+        started = time.perf_counter_ns()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter_ns() - started
+        if elapsed >= min_time * 1e9 / rounds:
+            break
+        loops *= 2
+
+    best = float("inf")
+    for _ in range(rounds):
+        started = time.perf_counter_ns()
+        for _ in range(loops):
+            func()
+        best = min(best, (time.perf_counter_ns() - started) / loops)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    base = tracemalloc.get_traced_memory()[0]
+    func()
+    peak = tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+
+    return {"ns_per_txn": best / n, "peak_bytes_per_txn": peak / n}
+
+def run(sizes=SIZES, min_time: float = 0.5, rounds: int = 5) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for n in sizes:
+        for name, func in make_cases(n).items():
+            results[f"{name}[{n}]"] = measure(func, n, min_time, rounds)
+    return results
+
+def compare(results: Dict, baseline: Dict, threshold: float) -> list:
+    """Benchmarks whose ns/txn regressed by more than ``threshold`` percent"""
+    regressions = []
+    for key, current in results.items():
+        reference = baseline.get(key)
+        if reference is None:
+            continue
+        change = 100 * (current["ns_per_txn"] / reference["ns_per_txn"] - 1)
+        if change > threshold:
+            regressions.append((key, reference["ns_per_txn"], current["ns_per_txn"], change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Scoring hot-path microbenchmarks")
+    parser.add_argument("--check", action="store_true", help="Fail if slower than the baseline")
+    parser.add_argument("--update", action="store_true", help="Write results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=20.0, help="Allowed slowdown in percent")
+    parser.add_argument("--min-time", type=float, default=0.5, help="Seconds of timing per benchmark")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    args = parser.parse_args()
+
+    results = run(min_time=args.min_time)
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    print(f"{'benchmark':34} {'ns/txn':>14} {'baseline':>14} {'change':>8} {'peak B/txn':>12}")
+    for key, current in results.items():
+        reference = baseline.get(key, {}).get("ns_per_txn")
+        change = f"{100 * (current['ns_per_txn'] / reference - 1):+.1f}%" if reference else "-"
+        print(
+            f"{key:34} {current['ns_per_txn']:14.0f} {reference or 0:14.0f} {change:>8} "
+            f"{current['peak_bytes_per_txn']:12.0f}"
+        )
+
+    if args.update:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write("\n")
+
+    if args.check:
+        regressions = compare(results, baseline, args.threshold)
+        for key, reference, current, change in regressions:
+            print(f"REGRESSION {key}: {reference:.0f} -> {current:.0f} ns/txn ({change:+.1f}%)", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""Streaming export of scored transactions as CSV, Parquet or Arrow IPC.
+
+Rows are read through a server-side cursor in ``chunk_size`` batches and each
+batch is encoded and handed on before the next is fetched, so memory stays
+flat regardless of the export size. ``model_scores`` is flattened into one
+``score_<model>`` column per ensemble model. Parquet and Arrow need pyarrow.
+
+    python -m database.export --format parquet --output train.parquet \\
+        --start 2024-06-01 --end 2024-07-01 --decision BLOCK --decision REVIEW
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import sys
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database.models import Transaction
+from ml_models.ensemble_scorer import DEFAULT_WEIGHTS
+
+BASE_COLUMNS = [
+    'id', 'created_at', 'user_id', 'merchant_id', 'amount', 'currency', 'country', 'device_id',
+    'ip_address', 'transaction_type', 'channel', 'risk_score', 'risk_level', 'is_fraud',
+    'fraud_probability', 'decision', 'reviewed', 'actual_fraud'
+]
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows')
+}
+
+def export_query(start: Optional[datetime] = None, end: Optional[datetime] = None, decisions: Optional[List[str]] = None):
+    # Range filters on created_at let Postgres prune partitions
+    query = select(*[Transaction.__table__.c[c] for c in BASE_COLUMNS], Transaction.model_scores)
+    if start is not None:
+        query = query.where(Transaction.created_at >= start)
+    if end is not None:
+        query = query.where(Transaction.created_at < end)
+    if decisions:
+        query = query.where(Transaction.decision.in_(decisions))
+    return query.order_by(Transaction.created_at, Transaction.id)
+
+async def stream_rows(
+    engine: AsyncEngine,
+    models: List[str],
+    chunk_size: int = 10_000,
+    **filters
+) -> AsyncIterator[List[Dict]]:
+    """Flattened rows, ``chunk_size`` at a time, from a server-side cursor"""
+    async with engine.connect() as conn:
+        result = await conn.stream(export_query(**filters).execution_options(yield_per=chunk_size))
+        async for partition in result.partitions(chunk_size):
+            rows = []
+            for row in partition:
+                record = dict(zip(BASE_COLUMNS, row))
+                scores = row[-1] or {}
+                if isinstance(scores, str):
+                    scores = json.loads(scores)
+                for model in models:
+                    record[f"score_{model}"] = scores.get(model)
+                rows.append(record)
+            yield rows
+
+class _Sink:
+    """Write-only file object that hands out what was written since the last drain"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self.buffer += data
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+def _arrow_schema(columns: List[str]):
+    import pyarrow as pa
+    types = {
+        'created_at': pa.timestamp('us'), 'amount': pa.float64(), 'risk_score': pa.float64(),
+        'fraud_probability': pa.float64(), 'is_fraud': pa.bool_(), 'reviewed': pa.bool_(), 'actual_fraud': pa.bool_()
+    }
+    return pa.schema([
+        (c, types.get(c, pa.float64() if c.startswith('score_') else pa.string())) for c in columns
+    ])
+
+async def encode(chunks: AsyncIterator[List[Dict]], columns: List[str], file_format: str) -> AsyncIterator[bytes]:
+    """Encode row chunks as they arrive; one Parquet row group / Arrow batch per chunk"""
+    if file_format == 'csv':
+        text = io.StringIO()
+        writer = csv.DictWriter(text, fieldnames=columns)
+        writer.writeheader()
+        async for rows in chunks:
+            writer.writerows(rows)
+            yield text.getvalue().encode()
+            text.seek(0)
+            text.truncate()
+        if text.tell():
+            yield text.getvalue().encode()
+        return
+
+    import pyarrow as pa
+    schema = _arrow_schema(columns)
+    sink = _Sink()
+    if file_format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    async for rows in chunks:
+        writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def export_columns(models: List[str]) -> List[str]:
+    return BASE_COLUMNS + [f"score_{model}" for model in models]
+
+async def export(engine: AsyncEngine, file_format: str, chunk_size: int = 10_000, models: Optional[List[str]] = None, **filters) -> AsyncIterator[bytes]:
+    models = models or list(DEFAULT_WEIGHTS)
+    async for data in encode(stream_rows(engine, models, chunk_size, **filters), export_columns(models), file_format):
+        yield data
+
+async def main():
+    parser = argparse.ArgumentParser(description="Stream scored transactions to CSV, Parquet or Arrow")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="parquet")
+    parser.add_argument("--output", required=True, help="Output file, or - for stdout")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="Inclusive created_at lower bound")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="Exclusive created_at upper bound")
+    parser.add_argument("--decision", action="append", help="Only these decisions (repeatable)")
+    parser.add_argument("--model", action="append", help="Score columns to flatten (default: built-in ensemble)")
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    args = parser.parse_args()
+
+    from database.connection import engine
+    models = args.model or list(DEFAULT_WEIGHTS)
+    counted = {"rows": 0}
+
+    async def counting(chunks):
+        async for rows in chunks:
+            counted["rows"] += len(rows)
+            yield rows
+
+    started = time.perf_counter()
+    out = sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+    try:
+        chunks = counting(stream_rows(engine, models, args.chunk_size, start=args.start, end=args.end, decisions=args.decision))
+        async for data in encode(chunks, export_columns(models), args.format):
+            out.write(data)
+    finally:
+        if out is not sys.stdout.buffer:
+            out.close()
+        await engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "rows": counted["rows"],
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(counted["rows"] / elapsed, 1) if elapsed else 0.0
+    }), file=sys.stderr)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,6 @@
-from sqlalchemy import Column, String, Float, Integer, DateTime, Boolean, JSON
+from sqlalchemy import Column, String, Float, Integer, BigInteger, DateTime, Boolean, JSON, Index
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 
 Base = declarative_base()
 
@@ -27,10 +27,15 @@ class Transaction(Base):
     model_scores = Column(JSON)
     reasons = Column(JSON)
     
-    created_at = Column(DateTime, default=func.now(), index=True)
+    created_at = Column(DateTime, default=func.now())
     
     reviewed = Column(Boolean, default=False)
     actual_fraud = Column(Boolean, nullable=True)
+    
+    __table_args__ = (
+        # Keyset pagination on (created_at, id)
+        Index('ix_transactions_created_at_id', 'created_at', 'id'),
+    )
 
 class Alert(Base):
     __tablename__ = "alerts"
@@ -42,4 +47,48 @@ class Alert(Base):
     message = Column(String, nullable=False)
     details = Column(JSON)
     resolved = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=func.now())
\ No newline at end of file
+    created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        Index('ix_alerts_created_at_id', 'created_at', 'id'),
+        # Unresolved alerts are the hot subset: listing and counting them stays small
+        Index(
+            'ix_alerts_unresolved_created_at_id', 'created_at', 'id',
+            postgresql_where=text('resolved = false'),
+            sqlite_where=text('resolved = 0')
+        ),
+    )
+
+class DashboardRollup(Base):
+    """Running totals behind /analytics/dashboard, one row per (risk_level, decision, is_fraud)"""
+    __tablename__ = "dashboard_rollup"
+    
+    risk_level = Column(String, primary_key=True)
+    decision = Column(String, primary_key=True)
+    is_fraud = Column(Boolean, primary_key=True)
+    
+    count = Column(BigInteger, nullable=False, default=0)
+    risk_sum = Column(Float, nullable=False, default=0.0)
+    amount_sum = Column(Float, nullable=False, default=0.0)
+
+class AlertRollup(Base):
+    """Running alert totals per severity"""
+    __tablename__ = "alert_rollup"
+    
+    severity = Column(String, primary_key=True)
+    
+    total = Column(BigInteger, nullable=False, default=0)
+    unresolved = Column(BigInteger, nullable=False, default=0)
+
+
+class HourlyRollup(Base):
+    """Per-hour, per-risk-level totals behind /analytics/trends"""
+    __tablename__ = "hourly_rollup"
+    
+    bucket = Column(DateTime, primary_key=True)
+    risk_level = Column(String, primary_key=True)
+    
+    count = Column(BigInteger, nullable=False, default=0)
+    fraud_count = Column(BigInteger, nullable=False, default=0)
+    risk_sum = Column(Float, nullable=False, default=0.0)
+    amount_sum = Column(Float, nullable=False, default=0.0)
@@ -0,0 +1,34 @@
+import base64
+from datetime import datetime
+from typing import Any, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+def encode_cursor(created_at: datetime, row_id) -> str:
+    """Opaque cursor for the row after which the next page starts"""
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str, id_type: type = str) -> Tuple[datetime, Any]:
+    """(created_at, id) of ``cursor``, the id converted to ``id_type``; 400 if it does not parse"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), id_type(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def keyset_page(query, created_at_column, id_column, cursor: Optional[str], limit: int):
+    """Newest-first page of ``query`` after ``cursor``, fetching one extra row to detect a next page"""
+    if cursor:
+        created_at, row_id = decode_cursor(cursor, id_column.type.python_type)
+        query = query.where(tuple_(created_at_column, id_column) < tuple_(created_at, row_id))
+    return query.order_by(created_at_column.desc(), id_column.desc()).limit(limit + 1)
+
+def split_page(rows: list, limit: int) -> Tuple[list, Optional[str]]:
+    """Trim the look-ahead row and build the cursor for the next page"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
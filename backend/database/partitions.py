@@ -0,0 +1,281 @@
+"""Range partitioning of ``transactions`` and ``alerts`` on ``created_at`` (Postgres only).
+
+Each table is a partitioned parent with one child per day (or month). Future
+partitions are created ahead of time, and retention detaches partitions older
+than ``RETENTION_DAYS``, archives them to gzip CSV and drops them. The cost of
+a drop does not depend on the table size, and the hot working set stays at
+roughly retention / interval partitions. Queries that filter on ``created_at``
+are pruned to the matching partitions.
+
+The ORM still maps ``id`` as the primary key; in the database the key is
+(id, created_at), because Postgres requires the partition key in every
+unique constraint. Transaction ids therefore stay unique through a small
+unpartitioned ``transaction_ids`` table that every insert claims first;
+retention prunes it together with the partitions, so an id can only be
+reused after its transaction was archived. Dashboard rollups keep all-time
+totals after retention.
+
+Rows outside every range partition land in the ``*_default`` partition.
+Creating a partition whose range already has rows there moves them into
+the new partition, and maintenance logs a warning while the default
+partition is not empty.
+
+    python -m database.partitions migrate     # convert existing heap tables
+    python -m database.partitions maintain    # create partitions, apply retention
+"""
+import asyncio
+import gzip
+import logging
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Index, MetaData, PrimaryKeyConstraint, String, Table, text
+from sqlalchemy.schema import CreateIndex, CreateTable, DDLElement
+
+from database.models import Transaction, Alert
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_MODELS = (Transaction, Alert)
+PARTITION_INTERVAL = os.getenv("PARTITION_INTERVAL", "day")
+PARTITION_PREMAKE = int(os.getenv("PARTITION_PREMAKE", "7"))
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "0"))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", "archive")
+
+# Serializes partition DDL between workers
+LOCK_KEY = 0x7472616E73
+
+# Global uniqueness of transaction ids across partitions
+TRANSACTION_IDS = Table(
+    "transaction_ids", MetaData(),
+    Column("id", String, primary_key=True),
+    Column("created_at", DateTime, nullable=False),
+    Index("ix_transaction_ids_created_at", "created_at")
+)
+
+def period_start(value: datetime, interval: str = PARTITION_INTERVAL) -> datetime:
+    if interval == "month":
+        return value.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def next_period(value: datetime, interval: str = PARTITION_INTERVAL) -> datetime:
+    if interval == "month":
+        return (value.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return value + timedelta(days=1)
+
+def partition_name(table: str, start: datetime, interval: str = PARTITION_INTERVAL) -> str:
+    return f"{table}_p{start:%Y%m}" if interval == "month" else f"{table}_p{start:%Y%m%d}"
+
+def partitioned_ddl(model) -> List[DDLElement]:
+    """CREATE TABLE ... PARTITION BY and its indexes, derived from the ORM table"""
+    table = model.__table__.to_metadata(MetaData())
+    table.c.created_at.nullable = False
+    table.c.created_at.primary_key = True
+    table.append_constraint(PrimaryKeyConstraint('id', 'created_at'))
+    table.dialect_options['postgresql']['partition_by'] = 'RANGE (created_at)'
+    return [CreateTable(table)] + [CreateIndex(index) for index in table.indexes]
+
+async def _relkind(conn, table: str) -> Optional[str]:
+    return (await conn.execute(text("SELECT relkind FROM pg_class WHERE relname = :t"), {"t": table})).scalar()
+
+async def ensure_transaction_ids(conn):
+    """Create ``transaction_ids`` if missing, seeded with the ids already stored"""
+    if await _relkind(conn, TRANSACTION_IDS.name) is not None:
+        return
+    await conn.execute(CreateTable(TRANSACTION_IDS))
+    for index in TRANSACTION_IDS.indexes:
+        await conn.execute(CreateIndex(index))
+    if await _relkind(conn, Transaction.__tablename__) is not None:
+        await conn.execute(text(
+            f"INSERT INTO {TRANSACTION_IDS.name} (id, created_at) "
+            f"SELECT id, COALESCE(created_at, now()) FROM {Transaction.__tablename__} ON CONFLICT DO NOTHING"
+        ))
+
+async def create_partitioned_tables(conn) -> List[str]:
+    """Create the partitioned parents if the tables do not exist yet; returns the ones created"""
+    await ensure_transaction_ids(conn)
+    created = []
+    for model in PARTITIONED_MODELS:
+        if await _relkind(conn, model.__tablename__) is None:
+            for statement in partitioned_ddl(model):
+                await conn.execute(statement)
+            await conn.execute(text(f"CREATE TABLE {model.__tablename__}_default PARTITION OF {model.__tablename__} DEFAULT"))
+            created.append(model.__tablename__)
+    return created
+
+async def ensure_partitions(conn, start: datetime, end: datetime, interval: str = PARTITION_INTERVAL):
+    """Create every partition covering [start, end] that is missing"""
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:k)"), {"k": LOCK_KEY})
+    for model in PARTITIONED_MODELS:
+        table = model.__tablename__
+        if await _relkind(conn, table) != 'p':
+            continue
+        lower = period_start(start, interval)
+        while lower <= end:
+            upper = next_period(lower, interval)
+            name = partition_name(table, lower, interval)
+            if await _relkind(conn, name) is None:
+                await create_partition(conn, table, name, lower, upper)
+            lower = upper
+
+async def create_partition(conn, table: str, name: str, lower: datetime, upper: datetime):
+    """Add the [lower, upper) partition, moving rows of that range out of the default partition"""
+    bounds = {"lower": lower, "upper": upper}
+    values = f"FOR VALUES FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    default = f"{table}_default"
+    stray = 0
+    if await _relkind(conn, default) is not None:
+        stray = (await conn.execute(text(
+            f"SELECT count(*) FROM {default} WHERE created_at >= :lower AND created_at < :upper"
+        ), bounds)).scalar()
+    if not stray:
+        await conn.execute(text(f"CREATE TABLE {name} PARTITION OF {table} {values}"))
+        return
+    # Postgres refuses a new partition while the default partition holds rows in its range
+    logger.warning("Moving %d rows from %s into new partition %s", stray, default, name)
+    await conn.execute(text(f"CREATE TABLE {name} (LIKE {table} INCLUDING DEFAULTS)"))
+    await conn.execute(text(
+        f"WITH moved AS (DELETE FROM {default} WHERE created_at >= :lower AND created_at < :upper RETURNING *) "
+        f"INSERT INTO {name} SELECT * FROM moved"
+    ), bounds)
+    await conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {name} {values}"))
+
+async def check_default_partitions(conn) -> List[str]:
+    """Warn about default partitions holding rows; returns their names"""
+    populated = []
+    for model in PARTITIONED_MODELS:
+        default = f"{model.__tablename__}_default"
+        if await _relkind(conn, default) is None:
+            continue
+        if (await conn.execute(text(f"SELECT EXISTS (SELECT 1 FROM {default})"))).scalar():
+            logger.warning("%s holds rows outside every range partition", default)
+            populated.append(default)
+    return populated
+
+async def list_partitions(conn, table: str) -> List[Tuple[str, datetime]]:
+    """(partition name, lower bound) for every range partition of ``table``, oldest first"""
+    result = await conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = :t"
+    ), {"t": table})
+    partitions = []
+    for (name,) in result:
+        suffix = name[len(table) + 2:]
+        if name.startswith(f"{table}_p") and suffix.isdigit():
+            partitions.append((name, datetime.strptime(suffix, "%Y%m%d" if len(suffix) == 8 else "%Y%m")))
+    return sorted(partitions, key=lambda p: p[1])
+
+async def archive_partition(conn, partition: str, archive_dir: str) -> str:
+    """Stream a detached partition to ``archive_dir/<partition>.csv.gz`` and fsync it"""
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{partition}.csv.gz")
+    tmp = f"{path}.tmp"
+    raw = await conn.get_raw_connection()
+    with open(tmp, 'wb') as f:
+        with gzip.GzipFile(fileobj=f, mode='wb') as gz:
+            async def write(chunk: bytes):
+                gz.write(chunk)
+            await raw.driver_connection.copy_from_table(partition, output=write, format='csv', header=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return path
+
+async def apply_retention(engine, keep_days: int, archive_dir: str = ARCHIVE_DIR, now: Optional[datetime] = None) -> List[str]:
+    """Detach, archive and drop partitions that end more than ``keep_days`` ago"""
+    cutoff = (now or datetime.utcnow()) - timedelta(days=keep_days)
+    dropped = []
+    async with engine.connect() as lock:
+        # Only one worker runs retention at a time; the others skip this round
+        if not (await lock.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": LOCK_KEY + 1})).scalar():
+            return dropped
+        try:
+            for model in PARTITIONED_MODELS:
+                table = model.__tablename__
+                async with engine.connect() as conn:
+                    partitions = await list_partitions(conn, table)
+                for partition, lower in partitions:
+                    interval = "day" if len(partition) - len(table) - 2 == 8 else "month"
+                    if next_period(lower, interval) > cutoff:
+                        break
+                    # Detach first so writes and queries stop seeing it, then archive, then drop
+                    async with engine.begin() as conn:
+                        await conn.execute(text(f"ALTER TABLE {table} DETACH PARTITION {partition}"))
+                    async with engine.connect() as conn:
+                        path = await archive_partition(conn, partition, archive_dir)
+                    async with engine.begin() as conn:
+                        await conn.execute(text(f"DROP TABLE {partition}"))
+                        if table == Transaction.__tablename__:
+                            await conn.execute(
+                                text(f"DELETE FROM {TRANSACTION_IDS.name} WHERE created_at < :upper"),
+                                {"upper": next_period(lower, interval)}
+                            )
+                    logger.info("Archived %s to %s", partition, path)
+                    dropped.append(partition)
+        finally:
+            await lock.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY + 1})
+    return dropped
+
+async def maintain(engine, now: Optional[datetime] = None):
+    """Create upcoming partitions and apply retention"""
+    now = now or datetime.utcnow()
+    async with engine.begin() as conn:
+        await ensure_partitions(conn, now - timedelta(days=1), now + timedelta(days=PARTITION_PREMAKE))
+    async with engine.connect() as conn:
+        await check_default_partitions(conn)
+    if RETENTION_DAYS > 0:
+        await apply_retention(engine, RETENTION_DAYS, now=now)
+
+async def run_maintenance(engine, interval: float = 3600.0):
+    while True:
+        try:
+            await maintain(engine)
+        except Exception:
+            logger.exception("Partition maintenance failed")
+        await asyncio.sleep(interval)
+
+async def migrate(engine):
+    """Convert existing heap tables into partitioned tables, copying their rows"""
+    async with engine.begin() as conn:
+        for model in PARTITIONED_MODELS:
+            table = model.__tablename__
+            if await _relkind(conn, table) != 'r':
+                continue
+            legacy = f"{table}_legacy"
+            await conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+            indexes = await conn.execute(text("SELECT indexname FROM pg_indexes WHERE tablename = :t"), {"t": legacy})
+            for (index,) in indexes.all():
+                await conn.execute(text(f"ALTER INDEX {index} RENAME TO {index}_legacy"))
+
+            for statement in partitioned_ddl(model):
+                await conn.execute(statement)
+            await conn.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+            await conn.execute(text(f"UPDATE {legacy} SET created_at = now() WHERE created_at IS NULL"))
+            bounds = (await conn.execute(text(f"SELECT min(created_at), max(created_at) FROM {legacy}"))).first()
+            if bounds[0] is not None:
+                await ensure_partitions(conn, bounds[0], bounds[1])
+
+            columns = ", ".join(c.name for c in model.__table__.columns)
+            await conn.execute(text(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {legacy}"))
+            if table == Alert.__tablename__:
+                await conn.execute(text(
+                    "SELECT setval(pg_get_serial_sequence('alerts', 'id'), COALESCE((SELECT max(id) FROM alerts), 0) + 1, false)"
+                ))
+            await conn.execute(text(f"DROP TABLE {legacy}"))
+            logger.info("Migrated %s to a partitioned table", table)
+    await maintain(engine)
+
+async def main(command: str):
+    from database.connection import engine, init_db
+    await init_db()
+    if command == "migrate":
+        await migrate(engine)
+    else:
+        await maintain(engine)
+    await engine.dispose()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "maintain"))
@@ -0,0 +1,308 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, delete, exists, func, case, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+
+from database.models import Transaction, Alert, DashboardRollup, AlertRollup, HourlyRollup
+
+logger = logging.getLogger(__name__)
+
+def upsert(conn, model):
+    """Dialect-specific INSERT ... ON CONFLICT for the rollup tables"""
+    if conn.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(model)
+
+def hour_bucket(value: datetime) -> datetime:
+    return value.replace(minute=0, second=0, microsecond=0)
+
+def sql_hour_bucket(conn, column):
+    """Truncate a timestamp column to the hour in SQL"""
+    if conn.dialect.name == "postgresql":
+        return func.date_trunc('hour', column)
+    return func.strftime('%Y-%m-%d %H:00:00', column)
+
+async def upsert_increments(conn, model, keys: List[str], rows: List[Dict]):
+    """Add each row's non-key columns onto the existing rollup row, creating it if missing"""
+    if not rows:
+        return
+    stmt = upsert(conn, model)
+    table = model.__table__
+    additive = [c for c in rows[0] if c not in keys]
+    stmt = stmt.on_conflict_do_update(
+        index_elements=keys,
+        set_={c: table.c[c] + stmt.excluded[c] for c in additive}
+    )
+    # Sorted so concurrent flushers lock rollup rows in the same order
+    await conn.execute(stmt, sorted(rows, key=lambda r: tuple(str(r[k]) for k in keys)))
+
+class RollupAccumulator:
+    """In-process deltas for the rollup tables, checkpointed to the database.
+
+    Scored rows are folded into small per-group counters in O(1) and flushed
+    every ``flush_interval`` seconds as additive upserts, so every worker can
+    contribute without contending on the rollup rows per request. Readers add
+    this worker's unflushed deltas on top of the table.
+    """
+
+    def __init__(self, flush_interval: float = 1.0):
+        self.flush_interval = flush_interval
+        self._task: Optional[asyncio.Task] = None
+        self._engine: Optional[AsyncEngine] = None
+        self._reset()
+
+    def _reset(self):
+        self.dashboard = defaultdict(lambda: [0, 0.0, 0.0])
+        self.alerts = defaultdict(lambda: [0, 0])
+        self.hourly = defaultdict(lambda: [0, 0, 0.0, 0.0])
+
+    def record(self, transaction_rows: List[Dict], alert_rows: List[Optional[Dict]]):
+        """Fold committed transaction and alert rows into the pending deltas"""
+        for row in transaction_rows:
+            entry = self.dashboard[(row['risk_level'], row['decision'], row['is_fraud'])]
+            entry[0] += 1
+            entry[1] += row['risk_score']
+            entry[2] += row['amount']
+            entry = self.hourly[(hour_bucket(row['created_at']), row['risk_level'])]
+            entry[0] += 1
+            entry[1] += 1 if row['is_fraud'] else 0
+            entry[2] += row['risk_score']
+            entry[3] += row['amount']
+        for row in alert_rows:
+            if row is not None:
+                entry = self.alerts[row['severity']]
+                entry[0] += 1
+                entry[1] += 1
+
+    def record_resolved(self, severity: str, n: int = 1):
+        self.alerts[severity][1] -= n
+
+    async def flush(self, conn=None):
+        """Write pending deltas; they are merged back if the write fails"""
+        dashboard, alerts, hourly = self.dashboard, self.alerts, self.hourly
+        if not dashboard and not alerts and not hourly:
+            return
+        self._reset()
+        dashboard_rows = [
+            dict(risk_level=k[0], decision=k[1], is_fraud=k[2], count=v[0], risk_sum=v[1], amount_sum=v[2])
+            for k, v in dashboard.items()
+        ]
+        alert_rows = [dict(severity=k, total=v[0], unresolved=v[1]) for k, v in alerts.items()]
+        hourly_rows = [
+            dict(bucket=k[0], risk_level=k[1], count=v[0], fraud_count=v[1], risk_sum=v[2], amount_sum=v[3])
+            for k, v in hourly.items()
+        ]
+        try:
+            if conn is not None:
+                await self._write(conn, dashboard_rows, alert_rows, hourly_rows)
+            else:
+                async with self._engine.begin() as conn:
+                    await self._write(conn, dashboard_rows, alert_rows, hourly_rows)
+        except Exception:
+            self._merge(self.dashboard, dashboard)
+            self._merge(self.alerts, alerts)
+            self._merge(self.hourly, hourly)
+            raise
+
+    async def _write(self, conn, dashboard_rows: List[Dict], alert_rows: List[Dict], hourly_rows: List[Dict]):
+        await upsert_increments(conn, DashboardRollup, ['risk_level', 'decision', 'is_fraud'], dashboard_rows)
+        await upsert_increments(conn, AlertRollup, ['severity'], alert_rows)
+        await upsert_increments(conn, HourlyRollup, ['bucket', 'risk_level'], hourly_rows)
+
+    @staticmethod
+    def _merge(target, deltas):
+        for key, values in deltas.items():
+            entry = target[key]
+            for i, value in enumerate(values):
+                entry[i] += value
+
+    async def start(self, engine: AsyncEngine):
+        self._engine = engine
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._engine is not None:
+            await self.flush()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Rollup flush failed; deltas kept for the next attempt")
+
+rollups = RollupAccumulator()
+
+async def read_dashboard(db: AsyncSession) -> Dict:
+    """Dashboard totals from the rollup tables plus this worker's unflushed deltas"""
+    groups = defaultdict(lambda: [0, 0.0, 0.0])
+    result = await db.execute(select(
+        DashboardRollup.risk_level, DashboardRollup.decision, DashboardRollup.is_fraud,
+        DashboardRollup.count, DashboardRollup.risk_sum, DashboardRollup.amount_sum
+    ))
+    for risk_level, decision, is_fraud, count, risk_sum, amount_sum in result:
+        entry = groups[(risk_level, decision, is_fraud)]
+        entry[0] += count
+        entry[1] += risk_sum
+        entry[2] += amount_sum
+    for key, values in rollups.dashboard.items():
+        entry = groups[key]
+        for i, value in enumerate(values):
+            entry[i] += value
+
+    unresolved = (await db.execute(select(func.coalesce(func.sum(AlertRollup.unresolved), 0)))).scalar() or 0
+    unresolved += sum(v[1] for v in rollups.alerts.values())
+
+    total = sum(v[0] for v in groups.values())
+    fraud = sum(v[0] for k, v in groups.items() if k[2])
+    risk_distribution = defaultdict(int)
+    decision_distribution = defaultdict(int)
+    for (risk_level, decision, _), values in groups.items():
+        if values[0]:
+            risk_distribution[risk_level] += values[0]
+            decision_distribution[decision] += values[0]
+
+    return {
+        "total_transactions": total,
+        "fraud_detected": fraud,
+        "fraud_rate": fraud / total if total > 0 else 0,
+        "average_risk_score": sum(v[1] for v in groups.values()) / total if total > 0 else 0.0,
+        "total_amount_processed": float(sum(v[2] for v in groups.values())),
+        "risk_distribution": dict(risk_distribution),
+        "decision_distribution": dict(decision_distribution),
+        "unresolved_alerts": int(unresolved)
+    }
+
+async def read_trends(db: AsyncSession, start: datetime, granularity: str = "day") -> List[Dict]:
+    """Trend points from the hourly rollup, restricted to buckets at or after ``start``"""
+    points = defaultdict(lambda: {'total': 0, 'fraud': 0, 'risk_sum': 0.0, 'amount': 0.0, 'risk_levels': defaultdict(int)})
+
+    def fold(bucket: datetime, risk_level: str, count: int, fraud_count: int, risk_sum: float, amount_sum: float):
+        key = bucket.date().isoformat() if granularity == "day" else bucket.isoformat()
+        point = points[key]
+        point['total'] += count
+        point['fraud'] += fraud_count
+        point['risk_sum'] += risk_sum
+        point['amount'] += amount_sum
+        point['risk_levels'][risk_level] += count
+
+    result = await db.execute(
+        select(
+            HourlyRollup.bucket, HourlyRollup.risk_level, HourlyRollup.count,
+            HourlyRollup.fraud_count, HourlyRollup.risk_sum, HourlyRollup.amount_sum
+        ).where(HourlyRollup.bucket >= start)
+    )
+    for row in result:
+        fold(*row)
+    for (bucket, risk_level), values in rollups.hourly.items():
+        if bucket >= start:
+            fold(bucket, risk_level, *values)
+
+    trends = []
+    for key in sorted(points):
+        point = points[key]
+        trends.append({
+            "date": key,
+            "total": point['total'],
+            "fraud": point['fraud'],
+            "average_risk": point['risk_sum'] / point['total'] if point['total'] > 0 else 0,
+            "amount": point['amount'],
+            "risk_levels": dict(point['risk_levels'])
+        })
+    return trends
+
+# Each rollup table and the base table it summarizes
+ROLLUP_SOURCES = ((DashboardRollup, Transaction), (AlertRollup, Alert), (HourlyRollup, Transaction))
+
+async def _has_rows(conn, model) -> bool:
+    return (await conn.execute(select(exists().select_from(model.__table__)))).scalar()
+
+async def rollups_missing(conn) -> bool:
+    """True when a rollup table is empty although its base table has rows"""
+    for rollup, base in ROLLUP_SOURCES:
+        if not await _has_rows(conn, rollup) and await _has_rows(conn, base):
+            return True
+    return False
+
+async def rebuild_rollups(conn, only_if_empty: bool = False) -> bool:
+    """Recompute the rollup tables from the base tables (reconciliation).
+
+    Deltas other workers have not flushed yet are counted again once they
+    land, so run this while scoring is paused or expect drift of up to one
+    flush interval. Returns False when ``only_if_empty`` is set and no rollup
+    table is empty while its base table has rows (e.g. ``hourly_rollup`` on
+    a database that predates it).
+    """
+    if conn.dialect.name == "postgresql":
+        # Serialize concurrent rebuilds (e.g. N workers starting at once)
+        await conn.execute(text("LOCK TABLE dashboard_rollup, alert_rollup, hourly_rollup IN EXCLUSIVE MODE"))
+    if only_if_empty and not await rollups_missing(conn):
+        return False
+
+    await conn.execute(delete(DashboardRollup))
+    await conn.execute(delete(AlertRollup))
+    await conn.execute(delete(HourlyRollup))
+
+    result = await conn.execute(
+        select(
+            Transaction.risk_level, Transaction.decision, Transaction.is_fraud,
+            func.count(Transaction.id), func.sum(Transaction.risk_score), func.sum(Transaction.amount)
+        ).group_by(Transaction.risk_level, Transaction.decision, Transaction.is_fraud)
+    )
+    dashboard_rows = [
+        dict(risk_level=r[0], decision=r[1], is_fraud=r[2], count=r[3], risk_sum=r[4] or 0.0, amount_sum=r[5] or 0.0)
+        for r in result
+    ]
+
+    result = await conn.execute(
+        select(
+            Alert.severity, func.count(Alert.id),
+            func.sum(case((Alert.resolved == False, 1), else_=0))
+        ).group_by(Alert.severity)
+    )
+    alert_rows = [dict(severity=r[0], total=r[1], unresolved=r[2] or 0) for r in result]
+
+    bucket = sql_hour_bucket(conn, Transaction.created_at)
+    result = await conn.execute(
+        select(
+            bucket, Transaction.risk_level, func.count(Transaction.id),
+            func.sum(case((Transaction.is_fraud == True, 1), else_=0)),
+            func.sum(Transaction.risk_score), func.sum(Transaction.amount)
+        ).where(Transaction.created_at.isnot(None)).group_by(bucket, Transaction.risk_level)
+    )
+    hourly_rows = [
+        dict(
+            bucket=datetime.fromisoformat(r[0]) if isinstance(r[0], str) else r[0],
+            risk_level=r[1], count=r[2], fraud_count=r[3] or 0, risk_sum=r[4] or 0.0, amount_sum=r[5] or 0.0
+        )
+        for r in result
+    ]
+
+    await upsert_increments(conn, DashboardRollup, ['risk_level', 'decision', 'is_fraud'], dashboard_rows)
+    await upsert_increments(conn, AlertRollup, ['severity'], alert_rows)
+    await upsert_increments(conn, HourlyRollup, ['bucket', 'risk_level'], hourly_rows)
+    return True
+
+async def reconcile():
+    from database.connection import engine, init_db
+    await init_db()
+    async with engine.begin() as conn:
+        await rebuild_rollups(conn)
+    await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(reconcile())
@@ -0,0 +1,192 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from database.models import Transaction, Alert
+from database.partitions import TRANSACTION_IDS
+from database.rollups import rollups
+
+logger = logging.getLogger(__name__)
+
+DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def _only_inserted(inserted: set, transaction_rows: List[Dict], alert_rows: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    if len(inserted) == len(transaction_rows):
+        return transaction_rows, alert_rows
+    logger.warning("Skipped %d already stored transactions", len(transaction_rows) - len(inserted))
+    return (
+        [row for row in transaction_rows if row['id'] in inserted],
+        [row for row in alert_rows if row['transaction_id'] in inserted]
+    )
+
+async def claim_transaction_ids(conn, transaction_rows: List[Dict], alert_rows: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """Register the ids in ``transaction_ids`` (Postgres); drops rows whose id is already taken"""
+    statement = postgresql.insert(TRANSACTION_IDS).on_conflict_do_nothing().returning(TRANSACTION_IDS.c.id)
+    ids = [{"id": row['id'], "created_at": row['created_at']} for row in transaction_rows]
+    inserted = set((await conn.execute(statement, ids)).scalars())
+    return _only_inserted(inserted, transaction_rows, alert_rows)
+
+async def insert_scored(conn, transaction_rows: List[Dict], alert_rows: List[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """Bulk insert scored transactions and their alerts (multi-row INSERT) on one connection or session.
+
+    Transactions whose id is already stored are skipped along with their
+    alerts (ON CONFLICT DO NOTHING), so a replayed client transaction id
+    cannot fail the batch it is in. Returns the rows actually inserted.
+    """
+    if transaction_rows:
+        dialect = conn.dialect if hasattr(conn, 'dialect') else conn.bind.dialect
+        if dialect.name == "postgresql":
+            # The partitioned table's key includes created_at, so uniqueness of id is checked here
+            transaction_rows, alert_rows = await claim_transaction_ids(conn, transaction_rows, alert_rows)
+        dialect_insert = DIALECT_INSERTS.get(dialect.name)
+        if dialect_insert is None:
+            await conn.execute(insert(Transaction), transaction_rows)
+        elif transaction_rows:
+            statement = dialect_insert(Transaction).on_conflict_do_nothing().returning(Transaction.id)
+            inserted = set((await conn.execute(statement, transaction_rows)).scalars())
+            transaction_rows, alert_rows = _only_inserted(inserted, transaction_rows, alert_rows)
+    if alert_rows:
+        await conn.execute(insert(Alert), alert_rows)
+    return transaction_rows, alert_rows
+
+class WriteBehindQueue:
+    """Bounded in-process queue that persists scored transactions in batches.
+
+    Requests enqueue their rows and return immediately; a background flusher
+    writes up to ``batch_size`` rows per transaction, flushing when the batch
+    is full or its oldest row is ``max_age`` seconds old. ``enqueue`` blocks
+    when ``max_size`` rows are pending, which pushes back on the scoring path
+    instead of growing memory without bound.
+
+    A batch that still fails after ``max_retries`` attempts is split in
+    halves down to single rows, so one bad row cannot take the rest of the
+    batch with it. Rows that cannot be written on their own are logged and
+    appended to ``dead_letter_path`` (JSON lines) when one is configured.
+    """
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        max_size: int = 10_000,
+        batch_size: int = 500,
+        max_age: float = 0.05,
+        max_retries: int = 3,
+        dead_letter_path: Optional[str] = None
+    ):
+        self.engine = engine
+        self.batch_size = batch_size
+        self.max_age = max_age
+        self.max_retries = max_retries
+        self.dead_letter_path = dead_letter_path
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_size)
+        self._task: Optional[asyncio.Task] = None
+
+        self.flushed_rows = 0
+        self.flush_count = 0
+        self.failed_rows = 0
+        self._latencies = deque(maxlen=1024)
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Drain everything still queued, then stop the flusher"""
+        if self._task is None:
+            return
+        await self.queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def enqueue(self, transaction_row: Dict, alert_row: Optional[Dict] = None):
+        await self.queue.put((transaction_row, alert_row))
+
+    async def enqueue_many(self, transaction_rows: List[Dict], alert_rows: List[Optional[Dict]]):
+        for transaction_row, alert_row in zip(transaction_rows, alert_rows):
+            await self.queue.put((transaction_row, alert_row))
+
+    def stats(self) -> Dict:
+        latencies = sorted(self._latencies)
+        return {
+            "mode": "write_behind",
+            "queue_depth": self.queue.qsize(),
+            "queue_capacity": self.queue.maxsize,
+            "flushed_rows": self.flushed_rows,
+            "flush_count": self.flush_count,
+            "failed_rows": self.failed_rows,
+            "flush_latency_ms_avg": 1000 * sum(latencies) / len(latencies) if latencies else 0.0,
+            "flush_latency_ms_p99": 1000 * latencies[int(0.99 * (len(latencies) - 1))] if latencies else 0.0
+        }
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            deadline = time.monotonic() + self.max_age
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _flush(self, batch: list):
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self._insert(batch)
+                return
+            except Exception:
+                logger.exception("Write-behind flush of %d rows failed (attempt %d/%d)", len(batch), attempt, self.max_retries)
+                if attempt < self.max_retries:
+                    await asyncio.sleep(0.1 * 2 ** attempt)
+        # Retrying did not help, so look for the rows that cannot be written
+        await self._split(batch)
+
+    async def _split(self, batch: list):
+        if len(batch) == 1:
+            return await self._dead_letter(batch[0])
+        middle = len(batch) // 2
+        for half in (batch[:middle], batch[middle:]):
+            try:
+                await self._insert(half)
+            except Exception:
+                await self._split(half)
+
+    async def _insert(self, batch: list):
+        transaction_rows = [t for t, _ in batch]
+        alert_rows = [a for _, a in batch if a is not None]
+        started = time.perf_counter()
+        async with self.engine.begin() as conn:
+            transaction_rows, alert_rows = await insert_scored(conn, transaction_rows, alert_rows)
+        self._latencies.append(time.perf_counter() - started)
+        rollups.record(transaction_rows, alert_rows)
+        self.flushed_rows += len(batch)
+        self.flush_count += 1
+
+    async def _dead_letter(self, item: tuple):
+        transaction_row, alert_row = item
+        self.failed_rows += 1
+        logger.error("Write-behind dropped transaction %s", transaction_row['id'])
+        if self.dead_letter_path is None:
+            return
+        try:
+            with open(self.dead_letter_path, 'a') as f:
+                f.write(json.dumps({"transaction": transaction_row, "alert": alert_row}, default=str) + "\n")
+        except OSError:
+            logger.exception("Could not write dead-letter row to %s", self.dead_letter_path)
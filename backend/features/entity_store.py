@@ -0,0 +1,350 @@
+import numpy as np
+from typing import Dict, Iterable, Sequence, Tuple
+
+EMPTY = -1
+DELETED = -2
+MAX_LOAD = 0.7
+HASH_MASK = 0x7FFFFFFF  # hashes are kept as 31-bit int32
+
+def _new_arena(size: int) -> np.ndarray:
+    # bytearray-backed, so probes can compare key bytes with bytearray.startswith
+    return np.frombuffer(bytearray(size), dtype=np.uint8)
+
+class EntityIndex:
+    """Interns string IDs to dense integer slots through an open-addressing hash index.
+
+    The index is a NumPy table of slot numbers probed linearly from the key's
+    hash; per-slot hash, offset and length columns point into one UTF-8 byte
+    arena, so a key costs its bytes plus about 25 bytes of bookkeeping instead
+    of a Python string and a dict entry. Freed slots are reused, and the arena
+    is compacted when it is mostly garbage. Python's ``hash`` is salted per
+    process, so the table is rebuilt (vectorized) when keys are loaded.
+    """
+
+    def __init__(self, capacity: int = 1024):
+        self._reset(capacity)
+
+    def _reset(self, capacity: int):
+        self.table = np.full(capacity * 2, EMPTY, dtype=np.int32)   # slot per bucket
+        self.hashes = np.zeros(capacity, dtype=np.int32)
+        self.offsets = np.zeros(capacity, dtype=np.int64)
+        self.lengths = np.full(capacity, -1, dtype=np.int32)  # -1 marks a free slot
+        self.arena = _new_arena(capacity * 16)
+        self.free = np.zeros(capacity, dtype=np.int32)
+        self.n_free = 0
+        self.next_slot = 0
+        self.arena_used = 0
+        self.garbage = 0
+        self.count = 0
+        self.tombstones = 0
+        self._bind_views()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key) != EMPTY
+
+    @property
+    def capacity(self) -> int:
+        return len(self.lengths)
+
+    def get(self, key: str) -> int:
+        """Slot of ``key``, or -1"""
+        # _probe inlined: this is the per-transaction lookup
+        h = hash(key) & HASH_MASK
+        table = self._table
+        mask = self._mask
+        position = h & mask
+        while True:
+            slot = table[position]
+            if slot == EMPTY:
+                return EMPTY
+            if slot >= 0 and self._hashes[slot] == h:
+                encoded = key.encode()
+                if self._lengths[slot] == len(encoded) and self._bytes.startswith(encoded, self._offsets[slot]):
+                    return slot
+            position = (position + 1) & mask
+
+    def intern(self, key: str) -> Tuple[int, bool]:
+        """Slot of ``key``, allocating one if needed; returns (slot, created)"""
+        slot = self.get(key)
+        if slot != EMPTY:
+            return slot, False
+        h = hash(key) & HASH_MASK
+        encoded = key.encode()
+        position = self._probe(h, encoded)[1]
+
+        size = len(self.table)
+        if (self.count + self.tombstones + 1) > size * MAX_LOAD:
+            # Double when live keys fill the table, otherwise just clear tombstones
+            self._rebuild(size * 2 if self.count + 1 > size * MAX_LOAD / 2 else size)
+            position = self._probe(h, encoded)[1]
+        elif self._table[position] == DELETED:
+            self.tombstones -= 1
+
+        if self.n_free:
+            self.n_free -= 1
+            slot = self._free[self.n_free]
+        else:
+            if self.next_slot == self.capacity:
+                self._grow()
+            slot = self.next_slot
+            self.next_slot += 1
+
+        length = len(encoded)
+        if self.arena_used + length > len(self.arena):
+            self._grow_arena(length)
+        offset = self.arena_used
+        self._arena[offset:offset + length] = encoded
+        self.arena_used += length
+
+        self._table[position] = slot
+        self._hashes[slot] = h
+        self._offsets[slot] = offset
+        self._lengths[slot] = length
+        self.count += 1
+        return slot, True
+
+    def remove(self, slot: int):
+        """Free ``slot`` and drop its key from the index"""
+        table = self._table
+        mask = len(table) - 1
+        position = self._hashes[slot] & mask
+        while table[position] != slot:
+            position = (position + 1) & mask
+        table[position] = DELETED
+        self.tombstones += 1
+        self.garbage += self._lengths[slot]
+        self._lengths[slot] = -1
+        if self.n_free == len(self.free):
+            self.free = np.concatenate([self.free, np.zeros_like(self.free)])
+            self._free = memoryview(self.free)
+        self._free[self.n_free] = slot
+        self.n_free += 1
+        self.count -= 1
+
+    def key(self, slot: int) -> str:
+        offset = self._offsets[slot]
+        return bytes(self._arena[offset:offset + self._lengths[slot]]).decode()
+
+    def lookup(self, keys: Iterable[str]) -> np.ndarray:
+        """Slots of many keys at once (-1 where missing)"""
+        get = self.get
+        return np.array([get(key) for key in keys], dtype=np.int64)
+
+    def live(self) -> np.ndarray:
+        """Allocated slots, ascending"""
+        return np.flatnonzero(self.lengths[:self.next_slot] >= 0)
+
+    def encode_keys(self, slots: np.ndarray) -> np.ndarray:
+        """Keys of ``slots`` as one NUL-separated UTF-8 blob, gathered without decoding"""
+        return self._gather(slots, separator=True)
+
+    def load_keys(self, blob: np.ndarray, n: int):
+        """Replace the contents with ``n`` keys from ``encode_keys``; key i gets slot i"""
+        blob = np.asarray(blob, dtype=np.uint8)
+        keys = bytes(blob).decode().split('\0') if n else []
+        if len(keys) != n:
+            raise ValueError(f"Key blob has {len(keys)} keys, expected {n}")
+        capacity = max(1024, 1 << max(n - 1, 1).bit_length())
+        self._reset(capacity)
+        if not n:
+            return
+        starts = np.concatenate([[0], np.flatnonzero(blob == 0) + 1])
+        self.arena = _new_arena(max(len(self.arena), len(blob)))
+        self.arena[:len(blob)] = blob
+        self.arena_used = len(blob)
+        self.garbage = n - 1  # the separators
+        self.offsets[:n] = starts
+        self.lengths[:n] = np.diff(np.concatenate([starts, [len(blob) + 1]])) - 1
+        self.hashes[:n] = np.fromiter((hash(key) & HASH_MASK for key in keys), dtype=np.int64, count=n)
+        self.next_slot = self.count = n
+        self._rebuild(len(self.table))
+
+    def _probe(self, h: int, encoded: bytes) -> Tuple[int, int]:
+        """(slot, table position) of ``key``; for a missing key the slot is -1 and the
+        position is where it should be inserted (the first tombstone on its path)"""
+        table = self._table
+        mask = self._mask
+        position = h & mask
+        insert_at = None
+        hashes, offsets, lengths, arena = self._hashes, self._offsets, self._lengths, self._bytes
+        while True:
+            slot = table[position]
+            if slot == EMPTY:
+                return EMPTY, position if insert_at is None else insert_at
+            if slot == DELETED:
+                if insert_at is None:
+                    insert_at = position
+            elif hashes[slot] == h and lengths[slot] == len(encoded) and arena.startswith(encoded, offsets[slot]):
+                return slot, position
+            position = (position + 1) & mask
+
+    def _rebuild(self, size: int):
+        """Re-insert every live slot into a fresh table of ``size`` buckets, vectorized.
+
+        Each round places, for every free bucket, the first pending key that
+        hashes to it; keys that lost move one bucket on, as linear probing would.
+        """
+        table = np.full(size, EMPTY, dtype=np.int32)
+        mask = size - 1
+        pending = self.live()
+        positions = self.hashes[pending] & mask
+        while len(pending):
+            open_ = np.flatnonzero(table[positions] == EMPTY)
+            winners, first = np.unique(positions[open_], return_index=True)
+            table[winners] = pending[open_[first]]
+            placed = np.zeros(len(pending), dtype=bool)
+            placed[open_[first]] = True
+            pending = pending[~placed]
+            positions = (positions[~placed] + 1) & mask
+        self.table = table
+        self.tombstones = 0
+        self._bind_views()
+
+    def _grow(self):
+        """Double slot capacity; amortized O(1) per key"""
+        capacity = self.capacity
+        self.hashes = np.concatenate([self.hashes, np.zeros(capacity, dtype=np.int32)])
+        self.offsets = np.concatenate([self.offsets, np.zeros(capacity, dtype=np.int64)])
+        self.lengths = np.concatenate([self.lengths, np.full(capacity, -1, dtype=np.int32)])
+        self._bind_views()
+
+    def _grow_arena(self, needed: int):
+        if self.garbage * 2 > self.arena_used:
+            # Mostly freed keys: compact instead of growing
+            live = self.live()
+            data = self._gather(live, separator=False)
+            lengths = self.lengths[live].astype(np.int64)
+            self.offsets[live] = np.cumsum(lengths) - lengths
+            self.arena_used = len(data)
+            self.garbage = 0
+            size = len(self.arena)
+            while self.arena_used + needed > size:
+                size *= 2
+            self.arena = _new_arena(size)
+            self.arena[:len(data)] = data
+        else:
+            size = len(self.arena) * 2
+            while self.arena_used + needed > size:
+                size *= 2
+            arena = _new_arena(size)
+            arena[:self.arena_used] = self.arena[:self.arena_used]
+            self.arena = arena
+        self._bind_views()
+
+    def _gather(self, slots: np.ndarray, separator: bool) -> np.ndarray:
+        lengths = self.lengths[slots].astype(np.int64)
+        if separator:
+            lengths = lengths + 1
+        total = int(lengths.sum())
+        starts = np.cumsum(lengths) - lengths
+        index = np.arange(total, dtype=np.int64) - np.repeat(starts - self.offsets[slots], lengths)
+        if not separator:
+            return self.arena[index]
+        # The byte after each key is the separator position; write NULs there
+        data = self.arena[np.minimum(index, len(self.arena) - 1)]
+        data[starts + lengths - 1] = 0
+        return data[:-1] if total else data
+
+    def _bind_views(self):
+        self._table = memoryview(self.table)
+        self._mask = len(self.table) - 1
+        self._hashes = memoryview(self.hashes)
+        self._offsets = memoryview(self.offsets)
+        self._lengths = memoryview(self.lengths)
+        self._arena = memoryview(self.arena)
+        self._bytes = self.arena.base.obj  # the bytearray from _new_arena
+        self._free = memoryview(self.free)
+
+class EntityStore:
+    """Per-entity columns in preallocated NumPy arrays, addressed through an ``EntityIndex``.
+
+    ``columns`` maps a name to (dtype, per-entity shape). Row ``slot`` of every
+    column belongs to the entity interned at that slot; columns grow with the
+    index, geometrically. ``generation`` changes whenever the arrays are
+    reallocated, so owners holding memoryviews know to rebind them.
+    """
+
+    def __init__(self, columns: Dict[str, Tuple[object, Tuple[int, ...]]], capacity: int = 1024):
+        self.specs = {name: (np.dtype(dtype), tuple(shape)) for name, (dtype, shape) in columns.items()}
+        self.index = EntityIndex(capacity)
+        self.columns = {name: np.zeros((capacity,) + shape, dtype=dtype) for name, (dtype, shape) in self.specs.items()}
+        self._rows = capacity
+        self.generation = 0
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.index
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def get(self, key: str) -> int:
+        """Slot of ``key``, or -1"""
+        return self.index.get(key)
+
+    def add(self, key: str) -> Tuple[int, bool]:
+        """Slot of ``key``, allocating a zeroed row if needed; returns (slot, created)"""
+        slot, created = self.index.intern(key)
+        if created and slot >= self._rows:
+            self._grow()
+        return slot, created
+
+    def remove(self, slot: int):
+        """Free ``slot``; its rows are zeroed so a reused slot starts clean"""
+        self.index.remove(slot)
+        for column in self.columns.values():
+            column[slot] = 0
+
+    def key(self, slot: int) -> str:
+        return self.index.key(slot)
+
+    def lookup(self, keys: Iterable[str]) -> np.ndarray:
+        return self.index.lookup(keys)
+
+    def live(self) -> np.ndarray:
+        return self.index.live()
+
+    def read(self, name: str, keys: Sequence[str], default=0) -> np.ndarray:
+        """Rows of column ``name`` for many keys in one gather; ``default`` where a key is unknown"""
+        slots = self.lookup(keys)
+        rows = self.columns[name][np.maximum(slots, 0)]
+        rows[slots < 0] = default
+        return rows
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Compacted copy of the live entities, for snapshots"""
+        live = self.live()
+        arrays = {name: column[live] for name, column in self.columns.items()}
+        arrays['keys'] = self.index.encode_keys(live)
+        return arrays
+
+    def load_arrays(self, arrays: Dict[str, np.ndarray]):
+        """Replace all state with arrays produced by ``to_arrays``"""
+        n = len(next(arrays[name] for name in self.columns))
+        self.index.load_keys(arrays['keys'], n)
+        capacity = self.index.capacity
+        self.columns = {name: np.zeros((capacity,) + shape, dtype=dtype) for name, (dtype, shape) in self.specs.items()}
+        for name, column in self.columns.items():
+            column[:n] = arrays[name]
+        self._rows = capacity
+        self.generation += 1
+
+    def nbytes(self) -> int:
+        index = self.index
+        return sum(column.nbytes for column in self.columns.values()) + sum(
+            array.nbytes for array in (index.table, index.hashes, index.offsets, index.lengths, index.arena, index.free)
+        )
+
+    def _grow(self):
+        capacity = self.index.capacity
+        for name, column in self.columns.items():
+            grown = np.zeros((capacity,) + column.shape[1:], dtype=column.dtype)
+            grown[:len(column)] = column
+            self.columns[name] = grown
+        self._rows = capacity
+        self.generation += 1
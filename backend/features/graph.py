@@ -0,0 +1,238 @@
+import numpy as np
+import os
+import tempfile
+from typing import Dict, Optional, Tuple
+
+from features.entity_store import EntityIndex
+
+_MIX = 0x9E3779B97F4A7C15
+_MASK64 = (1 << 64) - 1
+
+class EdgeSet:
+    """Open-addressing hash set of non-zero int64 keys stored in one NumPy array"""
+
+    def __init__(self, capacity: int = 1 << 16):
+        self.table = np.zeros(capacity, dtype=np.int64)
+        self._table = memoryview(self.table)
+        self.count = 0
+
+    def __len__(self) -> int:
+        return self.count
+
+    def add(self, key: int) -> bool:
+        """Insert ``key``; returns False if it was already present"""
+        if (self.count + 1) * 2 > len(self.table):
+            self._grow()
+        if self._insert(key):
+            self.count += 1
+            return True
+        return False
+
+    def _insert(self, key: int) -> bool:
+        table = self._table
+        mask = len(table) - 1
+        index = ((key * _MIX) & _MASK64) >> 32 & mask
+        while True:
+            current = table[index]
+            if current == 0:
+                table[index] = key
+                return True
+            if current == key:
+                return False
+            index = (index + 1) & mask
+
+    def _grow(self):
+        keys = self.table[self.table != 0].tolist()
+        self.table = np.zeros(len(self.table) * 2, dtype=np.int64)
+        self._table = memoryview(self.table)
+        for key in keys:
+            self._insert(key)
+
+class EntityGraph:
+    """Bipartite user–device/IP graph with incrementally maintained connected components.
+
+    Every transaction links its user to its device and IP. Components are kept
+    with a union-find (union by size, path halving), so each update costs
+    O(α(n)). Node IDs are interned in an ``EntityIndex``; per-node and
+    per-component state lives in preallocated integer arrays that grow
+    geometrically; edges are deduplicated in an ``EdgeSet``.
+
+    Union-find cannot delete nodes, so memory is bounded by compaction: once
+    the graph reaches ``max_nodes``, it is rebuilt from the most recently
+    seen ``COMPACT_KEEP`` share of nodes and the edges among them. Component
+    totals are re-derived from per-user transaction counts. Rebuilds cost
+    O(nodes + edges) and happen once per ``max_nodes / 4`` new nodes.
+    """
+
+    COMPACT_KEEP = 0.75
+    NODE_ARRAYS = ('parent', 'size', 'txns', 'fraud', 'degree', 'node_txns', 'node_fraud', 'last_seen')
+
+    def __init__(self, capacity: int = 1024, max_nodes: Optional[int] = None):
+        self.max_nodes = max_nodes
+        self.ids = EntityIndex(capacity)
+        self._allocate(capacity)
+        self.edges = EdgeSet()
+        self._tick = 0
+        self.compactions = 0
+
+    def _allocate(self, capacity: int):
+        self.parent = np.arange(capacity, dtype=np.int64)
+        self.size = np.ones(capacity, dtype=np.int64)         # nodes per component (at roots)
+        self.txns = np.zeros(capacity, dtype=np.int64)        # transactions per component (at roots)
+        self.fraud = np.zeros(capacity, dtype=np.int64)       # flagged transactions per component (at roots)
+        self.degree = np.zeros(capacity, dtype=np.int64)      # distinct neighbours per node
+        self.node_txns = np.zeros(capacity, dtype=np.int64)   # transactions per user node
+        self.node_fraud = np.zeros(capacity, dtype=np.int64)  # flagged transactions per user node
+        self.last_seen = np.zeros(capacity, dtype=np.int64)   # transaction counter when last linked
+        self._bind_views()
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def add_transaction(self, user_id: str, device_id: str, ip_address: str) -> Tuple[int, int, float]:
+        """Link the transaction's entities; returns (component size, users on the device, component fraud density)"""
+        if self.max_nodes is not None and len(self.ids) + 3 > self.max_nodes:
+            self._compact()
+        user = self._node('u:' + user_id)
+        device = self._node('d:' + device_id)
+        ip = self._node('i:' + ip_address)
+
+        self._link(user, device)
+        self._link(user, ip)
+
+        self._tick += 1
+        last_seen = self._last_seen
+        last_seen[user] = last_seen[device] = last_seen[ip] = self._tick
+        self._node_txns[user] += 1
+        root = self.find(user)
+        self._txns[root] += 1
+        return self._size[root], self._degree[device], self._fraud[root] / self._txns[root]
+
+    def record_outcome(self, user_id: str, is_fraud: bool):
+        """Feed the scoring decision back so component fraud density reflects flagged activity"""
+        node = self.ids.get('u:' + user_id)
+        if node >= 0 and is_fraud:
+            self._node_fraud[node] += 1
+            self._fraud[self.find(node)] += 1
+
+    def find(self, node: int) -> int:
+        parent = self._parent
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    def _link(self, user: int, other: int):
+        if not self.edges.add((user << 32 | other) + 1):
+            return
+        self._degree[user] += 1
+        self._degree[other] += 1
+
+        a, b = self.find(user), self.find(other)
+        if a == b:
+            return
+        if self._size[a] < self._size[b]:
+            a, b = b, a
+        self._parent[b] = a
+        self._size[a] += self._size[b]
+        self._txns[a] += self._txns[b]
+        self._fraud[a] += self._fraud[b]
+
+    def _node(self, key: str) -> int:
+        node, created = self.ids.intern(key)
+        if created and node >= len(self.parent):
+            self._grow()
+        return node
+
+    def _grow(self):
+        capacity = len(self.parent)
+        self.parent = np.concatenate([self.parent, np.arange(capacity, 2 * capacity, dtype=np.int64)])
+        self.size = np.concatenate([self.size, np.ones(capacity, dtype=np.int64)])
+        for name in self.NODE_ARRAYS[2:]:
+            setattr(self, name, np.concatenate([getattr(self, name), np.zeros(capacity, dtype=np.int64)]))
+        self._bind_views()
+
+    def _bind_views(self):
+        self._parent = memoryview(self.parent)
+        self._size = memoryview(self.size)
+        self._txns = memoryview(self.txns)
+        self._fraud = memoryview(self.fraud)
+        self._degree = memoryview(self.degree)
+        self._node_txns = memoryview(self.node_txns)
+        self._node_fraud = memoryview(self.node_fraud)
+        self._last_seen = memoryview(self.last_seen)
+
+    def _compact(self):
+        """Rebuild from the most recently seen nodes and the edges among them"""
+        n = len(self.ids)
+        keep = min(n, int(self.max_nodes * self.COMPACT_KEEP))
+        kept = np.sort(np.argpartition(self.last_seen[:n], n - keep)[n - keep:]) if keep < n else np.arange(n)
+        remap = np.full(n, -1, dtype=np.int64)
+        remap[kept] = np.arange(keep)
+        edges = self.edges.table[self.edges.table != 0] - 1
+        users, others = remap[edges >> 32], remap[edges & 0xFFFFFFFF]
+        alive = (users >= 0) & (others >= 0)
+
+        keys = self.ids.encode_keys(kept)
+        carried = {name: getattr(self, name)[kept] for name in ('node_txns', 'node_fraud', 'last_seen')}
+        capacity = max(1024, 1 << max(keep - 1, 1).bit_length())
+        self.ids = EntityIndex(capacity)
+        self.ids.load_keys(keys, keep)
+        self._allocate(capacity)
+        for name, values in carried.items():
+            getattr(self, name)[:keep] = values
+        self.edges = EdgeSet(max(1 << 16, 1 << (2 * int(alive.sum())).bit_length()))
+        for user, other in zip(users[alive].tolist(), others[alive].tolist()):
+            self._link(user, other)
+
+        # Component totals from the per-user counts of the surviving nodes
+        roots = np.fromiter((self.find(node) for node in range(keep)), dtype=np.int64, count=keep)
+        np.add.at(self.txns, roots, self.node_txns[:keep])
+        np.add.at(self.fraud, roots, self.node_fraud[:keep])
+        self.compactions += 1
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Copies of the graph state, safe to write out while scoring continues"""
+        n = len(self.ids)
+        arrays = {name: getattr(self, name)[:n].copy() for name in self.NODE_ARRAYS}
+        arrays.update(keys=self.ids.encode_keys(np.arange(n)), edges=self.edges.table.copy(), tick=np.array(self._tick))
+        return arrays
+
+    @staticmethod
+    def write(path: str, arrays: Dict[str, np.ndarray]):
+        """Write ``to_arrays`` output to ``path`` atomically (per-process temp file + rename)"""
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=f"{os.path.basename(path)}.")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp, 0o644)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def snapshot(self, path: str):
+        """Write the graph to ``path``; blocks while writing, see ``to_arrays`` and ``write``"""
+        self.write(path, self.to_arrays())
+
+    @classmethod
+    def load(cls, path: str, max_nodes: Optional[int] = None) -> "EntityGraph":
+        with np.load(path) as data:
+            n = len(data['parent'])
+            graph = cls(capacity=max(1024, 1 << max(n - 1, 1).bit_length()), max_nodes=max_nodes)
+            keys = data['keys']
+            if keys.dtype.kind == 'U':
+                # Snapshots from before node IDs were interned
+                keys = np.frombuffer('\0'.join(keys.tolist()).encode(), dtype=np.uint8)
+            graph.ids.load_keys(keys, n)
+            for name in cls.NODE_ARRAYS:
+                # Snapshots from before compaction lack the per-node counters
+                if name in data:
+                    getattr(graph, name)[:n] = data[name]
+            graph._tick = int(data['tick']) if 'tick' in data else 0
+            graph.edges.table = data['edges'].copy()
+            graph.edges._table = memoryview(graph.edges.table)
+            graph.edges.count = int(np.count_nonzero(graph.edges.table))
+        return graph
@@ -0,0 +1,283 @@
+import math
+import time
+import zlib
+from functools import lru_cache
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from features.entity_store import EntityStore
+
+N_FEATURES = 8
+# Below this many users an array round costs more than per-user updates
+VECTOR_MIN = 32
+
+# Linear-counting estimate of distinct merchants for each number of unset sketch bits
+DISTINCT_ESTIMATE = tuple(-64.0 * math.log(max(zeros, 1) / 64.0) for zeros in range(65))
+_DISTINCT_ESTIMATE = np.array(DISTINCT_ESTIMATE)
+
+def fingerprint(value: str) -> int:
+    return zlib.crc32(value.encode()) or 1
+
+# Countries and merchants repeat across users, so their fingerprints are worth caching
+cached_fingerprint = lru_cache(maxsize=1 << 16)(fingerprint)
+
+def _popcount(values: np.ndarray) -> np.ndarray:
+    return np.unpackbits(values.astype(np.uint64).view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+class UserProfiles:
+    """Incrementally maintained per-user behavioral profiles.
+
+    Values are compared through CRC-32 fingerprints (0 means unset), which are
+    stable across restarts unlike ``hash()``, so profiles can be snapshotted.
+
+    Per user: a Welford running mean/variance of the amount, an EWMA of the
+    time between transactions, fingerprints of the last country, device and
+    IP, the last ``recent_merchants`` distinct merchants, and a 64-bit
+    linear-counting sketch of distinct merchants. All of it sits in fixed-size
+    ``EntityStore`` columns (about 100 bytes per user), every update is O(1),
+    and users idle for ``idle_ttl`` seconds are evicted in amortized sweeps.
+    ``observe_many`` updates a whole batch with array operations.
+    """
+
+    def __init__(
+        self,
+        recent_merchants: int = 8,
+        gap_alpha: float = 0.2,
+        idle_ttl: float = 90 * 86400,
+        max_keys: Optional[int] = None,
+        capacity: int = 1024
+    ):
+        self.recent_merchants = recent_merchants
+        self.gap_alpha = gap_alpha
+        self.idle_ttl = idle_ttl
+        self.max_keys = max_keys
+        self.store = EntityStore({
+            'count': (np.uint32, ()),
+            'stats': (np.float64, (4,)),        # amount mean, amount M2, last time, inter-arrival EWMA
+            'last_seen': (np.uint32, (3,)),     # country, device, IP fingerprints
+            'merchants': (np.uint32, (recent_merchants,)),
+            'merchant_bits': (np.uint64, ())
+        }, capacity=capacity)
+        self._bind_views()
+        self._since_sweep = 0
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __contains__(self, user_id: str) -> bool:
+        return user_id in self.store
+
+    def observe(self, transaction: Dict, now: Optional[float] = None) -> Tuple[float, ...]:
+        """Profile features for ``transaction`` against the history before it, then fold it in.
+
+        Returns (amount z-score, amount / mean amount, usual gap / this gap,
+        new country, new device, new IP, new merchant, distinct merchants);
+        all zero for a user's first transaction.
+        """
+        now = time.time() if now is None else now
+        slot = self._index.get(transaction['user_id'])
+        if slot < 0:
+            slot = self._allocate(transaction['user_id'], now)
+
+        amount = transaction['amount']
+        country = cached_fingerprint(transaction['country'])
+        device = fingerprint(transaction['device_id'])
+        ip = fingerprint(transaction['ip_address'])
+        merchant = cached_fingerprint(transaction['merchant_id'])
+        k = self.recent_merchants
+        base = slot * k
+        merchants = self._merchants
+        stats = self._stats
+        row = slot * 4
+        fingerprints = self._fingerprints
+        seen = slot * 3
+        bits = self._merchant_bits[slot]
+
+        n = self._count[slot]
+        if n:
+            mean, m2, last_time, gap_ewma = stats[row], stats[row + 1], stats[row + 2], stats[row + 3]
+            std = math.sqrt(m2 / n) if n > 1 else 0.0
+            # Floor the spread so a user with near-constant amounts does not produce huge scores
+            zscore = (amount - mean) / max(std, 0.1 * mean, 1.0)
+            ratio = amount / mean if mean > 0 else 0.0
+            gap = now - last_time
+            gap_ratio = gap_ewma / max(gap, 1.0) if n > 1 else 0.0
+            new_merchant = 1.0
+            if bits >> (merchant & 63) & 1:
+                # Only a merchant whose sketch bit is set can be in the recent list
+                for i in range(base, base + k):
+                    if merchants[i] == merchant:
+                        new_merchant = 0.0
+                        break
+            new_country = fingerprints[seen] != country
+            new_device = fingerprints[seen + 1] != device
+            new_ip = fingerprints[seen + 2] != ip
+            features = (
+                zscore, ratio, gap_ratio, float(new_country), float(new_device), float(new_ip),
+                new_merchant, DISTINCT_ESTIMATE[64 - bits.bit_count()]
+            )
+        else:
+            mean = m2 = gap_ewma = gap = 0.0
+            new_merchant = new_country = new_device = new_ip = True
+            features = (0.0,) * N_FEATURES
+
+        # Welford update of the amount mean and sum of squared deviations
+        n += 1
+        delta = amount - mean
+        mean += delta / n
+        stats[row] = mean
+        stats[row + 1] = m2 + delta * (amount - mean)
+        stats[row + 2] = now
+        if n == 2:
+            stats[row + 3] = gap
+        elif n > 2:
+            stats[row + 3] = gap_ewma + self.gap_alpha * (gap - gap_ewma)
+        self._count[slot] = n
+        if new_country:
+            fingerprints[seen] = country
+        if new_device:
+            fingerprints[seen + 1] = device
+        if new_ip:
+            fingerprints[seen + 2] = ip
+        if new_merchant:
+            # Shift the recent-merchant list by one and put this merchant first
+            merchants[base + 1:base + k] = merchants[base:base + k - 1]
+            merchants[base] = merchant
+            self._merchant_bits[slot] = bits | 1 << (merchant & 63)
+
+        self._since_sweep += 1
+        if self._since_sweep >= 1024 and self._since_sweep >= len(self.store):
+            self.evict_idle(now)
+        return features
+
+    def observe_many(self, transactions: Sequence[Dict], now: Optional[float] = None) -> np.ndarray:
+        """Vectorized ``observe`` of a batch at a single ``now``.
+
+        Returns an (N, 8) array equal to calling ``observe`` for the
+        transactions in order. Users are processed in rounds, one occurrence
+        per user per round, so repeats within the batch see the earlier ones.
+        Rounds with fewer than ``VECTOR_MIN`` users are cheaper one by one,
+        so the rest of the batch goes through ``observe``, still in order.
+        """
+        now = time.time() if now is None else now
+        n = len(transactions)
+        features = np.zeros((n, N_FEATURES))
+        if n < VECTOR_MIN:
+            for i, transaction in enumerate(transactions):
+                features[i] = self.observe(transaction, now)
+            return features
+        user_ids = [txn['user_id'] for txn in transactions]
+        slots = self.store.lookup(user_ids)
+        # Touch known users first so allocating new ones cannot evict them
+        known = slots[slots >= 0]
+        previous = self.store['stats'][known, 2]
+        self.store['stats'][known, 2] = now
+        for i in np.flatnonzero(slots < 0).tolist():
+            slot = self.store.get(user_ids[i])
+            slots[i] = slot if slot >= 0 else self._allocate(user_ids[i], now)
+        self.store['stats'][known, 2] = previous
+
+        _, inverse, repeats = np.unique(slots, return_inverse=True, return_counts=True)
+        order = np.argsort(inverse, kind='stable')
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+        r = vectorized = 0
+        while len(items := np.flatnonzero(rank == r)) >= VECTOR_MIN:
+            batch = [transactions[i] for i in items.tolist()]
+            features[items] = self._observe_round(
+                slots[items],
+                np.array([txn['amount'] for txn in batch], dtype=np.float64),
+                np.array([
+                    (cached_fingerprint(txn['country']), fingerprint(txn['device_id']), fingerprint(txn['ip_address']))
+                    for txn in batch
+                ], dtype=np.uint32),
+                np.array([cached_fingerprint(txn['merchant_id']) for txn in batch], dtype=np.uint32),
+                now
+            )
+            vectorized += len(items)
+            r += 1
+        for i in np.flatnonzero(rank >= r).tolist():
+            features[i] = self.observe(transactions[i], now)
+
+        self._since_sweep += vectorized
+        if self._since_sweep >= 1024 and self._since_sweep >= len(self.store):
+            self.evict_idle(now)
+        return features
+
+    def _observe_round(self, slots: np.ndarray, amount: np.ndarray, fingerprints: np.ndarray, merchant: np.ndarray, now: float) -> np.ndarray:
+        """``observe`` for distinct ``slots`` at once; the same arithmetic, column by column"""
+        store = self.store
+        n = store['count'][slots].astype(np.int64)
+        mean, m2, last_time, gap_ewma = store['stats'][slots].T
+        recent = store['merchants'][slots]
+        bits = store['merchant_bits'][slots]
+        seen = n > 0
+        many = n > 1
+
+        std = np.where(many, np.sqrt(m2 / np.maximum(n, 1)), 0.0)
+        zscore = (amount - mean) / np.maximum(np.maximum(std, 0.1 * mean), 1.0)
+        ratio = np.where(mean > 0, amount / np.where(mean > 0, mean, 1.0), 0.0)
+        gap = np.where(seen, now - last_time, 0.0)
+        gap_ratio = np.where(many, gap_ewma / np.maximum(gap, 1.0), 0.0)
+        new_merchant = ~(recent == merchant[:, None]).any(axis=1)
+        features = np.column_stack([
+            zscore, ratio, gap_ratio, store['last_seen'][slots] != fingerprints,
+            new_merchant, _DISTINCT_ESTIMATE[64 - _popcount(bits)]
+        ])
+        features[~seen] = 0.0
+
+        count = n + 1
+        delta = amount - mean
+        mean = mean + delta / count
+        store['stats'][slots] = np.column_stack([
+            mean, m2 + delta * (amount - mean), np.full(len(slots), now),
+            np.where(count == 2, gap, np.where(count > 2, gap_ewma + self.gap_alpha * (gap - gap_ewma), gap_ewma))
+        ])
+        store['count'][slots] = count
+        store['last_seen'][slots] = fingerprints
+        store['merchants'][slots] = np.where(
+            new_merchant[:, None], np.concatenate([merchant[:, None], recent[:, :-1]], axis=1), recent
+        )
+        store['merchant_bits'][slots] = bits | np.left_shift(np.uint64(1), (merchant & 63).astype(np.uint64))
+        return features
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop every profile not updated for ``idle_ttl`` seconds"""
+        now = time.time() if now is None else now
+        self._since_sweep = 0
+        live = self.store.live()
+        idle = live[self.store['stats'][live, 2] < now - self.idle_ttl]
+        for slot in idle.tolist():
+            self.store.remove(slot)
+        return len(idle)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        return self.store.to_arrays()
+
+    def load_arrays(self, arrays: Dict[str, np.ndarray]):
+        self.store.load_arrays(arrays)
+        self._bind_views()
+        self._since_sweep = 0
+
+    def _allocate(self, user_id: str, now: float) -> int:
+        if self.max_keys is not None and len(self.store) >= self.max_keys:
+            if not self.evict_idle(now):
+                live = self.store.live()
+                n = min(max(1, self.max_keys // 100), len(live))
+                for slot in live[np.argpartition(self.store['stats'][live, 2], n - 1)[:n]].tolist():
+                    self.store.remove(slot)
+        slot, _ = self.store.add(user_id)
+        if self.store.generation != self._generation:
+            self._bind_views()
+        return slot
+
+    def _bind_views(self):
+        store = self.store
+        self._count = memoryview(store['count'])
+        self._stats = memoryview(store['stats'].reshape(-1))
+        self._fingerprints = memoryview(store['last_seen'].reshape(-1))
+        self._merchants = memoryview(store['merchants'].reshape(-1))
+        self._merchant_bits = memoryview(store['merchant_bits'])
+        self._index = store.index
+        self._generation = store.generation
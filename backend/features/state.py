@@ -0,0 +1,98 @@
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from utils.redis_client import RedisClient
+from utils.metrics import REDIS_SECONDS
+
+# Atomically read-and-increment sliding-window counters for every key in KEYS.
+# Each key is a hash whose fields are "<window>:<bucket>"; buckets that fell out
+# of their window are deleted as they are read. Returns the per-window counts
+# before the increment, flattened as [key1_w1, key1_w2, ..., key2_w1, ...].
+OBSERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local n_buckets = tonumber(ARGV[2])
+local amount = tonumber(ARGV[3])
+local result = {}
+for k = 1, #KEYS do
+    local fields = redis.call('HGETALL', KEYS[k])
+    local max_window = 0
+    for w = 4, #ARGV do
+        local window = tonumber(ARGV[w])
+        local bucket = math.floor(now * n_buckets / window)
+        local prefix = ARGV[w] .. ':'
+        local total = 0
+        for i = 1, #fields, 2 do
+            local name = fields[i]
+            if string.sub(name, 1, #prefix) == prefix then
+                if tonumber(string.sub(name, #prefix + 1)) > bucket - n_buckets then
+                    total = total + tonumber(fields[i + 1])
+                else
+                    redis.call('HDEL', KEYS[k], name)
+                end
+            end
+        end
+        result[#result + 1] = total
+        if amount > 0 then
+            redis.call('HINCRBY', KEYS[k], prefix .. string.format('%d', bucket), amount)
+        end
+        if window > max_window then max_window = window end
+    end
+    if amount > 0 then
+        redis.call('EXPIRE', KEYS[k], max_window)
+    end
+end
+return result
+"""
+
+class RedisFeatureState:
+    """Sliding-window velocity counters shared by every worker through Redis.
+
+    Each scored transaction costs one EVALSHA round-trip that reads and
+    increments both the user and the device counters; batches pipeline one
+    script call per transaction.
+    """
+
+    def __init__(
+        self,
+        redis_client: RedisClient,
+        windows: Sequence[int] = (60, 3600, 86400),
+        buckets: int = 12,
+        prefix: str = "fs"
+    ):
+        self.redis = redis_client
+        self.windows = tuple(windows)
+        self.buckets = buckets
+        self.prefix = prefix
+        self._script = None
+
+    def _keys(self, user_id: str, device_id: str) -> List[str]:
+        return [f"{self.prefix}:user:{user_id}", f"{self.prefix}:device:{device_id}"]
+
+    def _args(self, now: float, amount: int) -> list:
+        return [now, self.buckets, amount, *self.windows]
+
+    def _get_script(self):
+        if self._script is None:
+            self._script = self.redis.client.register_script(OBSERVE_SCRIPT)
+        return self._script
+
+    def _split(self, counts: list) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        n = len(self.windows)
+        return tuple(int(c) for c in counts[:n]), tuple(int(c) for c in counts[n:2 * n])
+
+    async def observe(self, user_id: str, device_id: str, now: Optional[float] = None) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+        """Count one transaction; returns (user_counts, device_counts) before it"""
+        now = time.time() if now is None else now
+        counts = await self._get_script()(keys=self._keys(user_id, device_id), args=self._args(now, 1))
+        return self._split(counts)
+
+    async def observe_many(self, pairs: List[Tuple[str, str]], now: Optional[float] = None) -> List[Tuple[Tuple[int, ...], Tuple[int, ...]]]:
+        """Count a batch of (user_id, device_id) transactions in one pipelined round-trip"""
+        now = time.time() if now is None else now
+        script = self._get_script()
+        async with self.redis.client.pipeline(transaction=False) as pipe:
+            for user_id, device_id in pairs:
+                await script(keys=self._keys(user_id, device_id), args=self._args(now, 1), client=pipe)
+            with REDIS_SECONDS.labels("pipeline").time():
+                results = await pipe.execute()
+        return [self._split(counts) for counts in results]
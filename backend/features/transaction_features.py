@@ -1,14 +1,62 @@
 import numpy as np
-from typing import Dict
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
 from datetime import datetime
 
+from features.velocity import SlidingWindowCounter
+from features.graph import EntityGraph
+from features.profiles import UserProfiles
+
+# Column order of the feature vector produced by extract_features
+FEATURE_NAMES = [
+    'amount', 'log_amount', 'user_velocity', 'device_velocity', 'hour', 'is_night',
+    'channel', 'transaction_type', 'high_risk_country',
+    'graph_component_size', 'graph_users_per_device', 'graph_fraud_density',
+    'amount_zscore', 'amount_to_mean', 'interarrival_ratio',
+    'new_country', 'new_device', 'new_ip', 'new_merchant', 'distinct_merchants'
+]
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+# Default for the high_risk_country feature; the rules file can replace it
+HIGH_RISK_COUNTRIES = ('NG', 'RU', 'CN', 'PK')
+
 class TransactionFeatureEngine:
-    def __init__(self):
-        self.user_history = {}
-        self.device_history = {}
+    def __init__(
+        self,
+        windows: Sequence[int] = (60, 3600, 86400),
+        velocity_window: int = 3600,
+        max_keys: Optional[int] = None,
+        high_risk_countries: Sequence[str] = HIGH_RISK_COUNTRIES,
+        graph_max_nodes: Optional[int] = None
+    ):
+        # Sliding-window transaction counts per user and per device
+        self.windows = tuple(windows)
+        self.velocity_index = self.windows.index(velocity_window)
+        self.user_history = SlidingWindowCounter(self.windows, max_keys=max_keys)
+        self.device_history = SlidingWindowCounter(self.windows, max_keys=max_keys)
+        
+        self.high_risk_countries = frozenset(high_risk_countries)
+        
+        # User/device/IP graph behind the network features
+        self.graph = EntityGraph(max_nodes=graph_max_nodes)
+        
+        # Per-user spend, timing and novelty profiles
+        self.profiles = UserProfiles(max_keys=max_keys)
     
-    def extract_features(self, transaction: Dict) -> np.ndarray:
-        """Extract features for ML models"""
+    def extract_features(
+        self,
+        transaction: Dict,
+        now: Optional[float] = None,
+        velocity: Optional[Tuple[Tuple[int, ...], Tuple[int, ...]]] = None,
+        profile: Optional[Sequence[float]] = None
+    ) -> np.ndarray:
+        """Extract features for ML models.
+
+        ``velocity`` carries (user_counts, device_counts) from a shared feature
+        state backend; when given, the local counters are not touched.
+        ``profile`` carries profile features already taken by ``observe_many``.
+        """
+        now = time.time() if now is None else now
         features = []
         
         # Amount features
@@ -16,18 +64,20 @@ class TransactionFeatureEngine:
         features.append(amount)
         features.append(np.log1p(amount))
         
-        # Velocity features
-        user_id = transaction['user_id']
-        user_txn_count = self.user_history.get(user_id, 0)
-        features.append(user_txn_count)
+        # Velocity features (transactions in the velocity window, before this one)
+        if velocity is None:
+            velocity = (
+                self.user_history.increment(transaction['user_id'], now),
+                self.device_history.increment(transaction['device_id'], now)
+            )
+        user_counts, device_counts = velocity
+        features.append(user_counts[self.velocity_index])
         
         # Device features
-        device_id = transaction['device_id']
-        device_txn_count = self.device_history.get(device_id, 0)
-        features.append(device_txn_count)
+        features.append(device_counts[self.velocity_index])
         
         # Time features
-        hour = datetime.now().hour
+        hour = datetime.fromtimestamp(now).hour
         features.append(hour)
         features.append(1 if 23 <= hour or hour <= 6 else 0)  # Night transaction
         
@@ -39,11 +89,69 @@ class TransactionFeatureEngine:
         features.append(type_encoding.get(transaction['transaction_type'], 0))
         
         # Country risk (simplified)
-        high_risk_countries = ['NG', 'RU', 'CN', 'PK']
-        features.append(1 if transaction['country'] in high_risk_countries else 0)
+        features.append(1 if transaction['country'] in self.high_risk_countries else 0)
+        
+        # Graph features
+        features.extend(self.graph.add_transaction(
+            transaction['user_id'], transaction['device_id'], transaction['ip_address']
+        ))
         
-        # Update history
-        self.user_history[user_id] = user_txn_count + 1
-        self.device_history[device_id] = device_txn_count + 1
+        # Profile features (against the user's history before this transaction)
+        features.extend(self.profiles.observe(transaction, now) if profile is None else profile)
         
-        return np.array(features, dtype=np.float32)
\ No newline at end of file
+        return np.array(features, dtype=np.float32)
+    
+    def extract_features_batch(
+        self,
+        transactions: List[Dict],
+        now: Optional[float] = None,
+        velocities: Optional[List[Tuple[Tuple[int, ...], Tuple[int, ...]]]] = None
+    ) -> np.ndarray:
+        """Extract an (N, F) feature matrix, updating history in request order"""
+        now = time.time() if now is None else now
+        if velocities is None:
+            # One vectorized counter update per batch; repeats of a key see the earlier ones
+            user_counts = self.user_history.increment_many([t['user_id'] for t in transactions], now)
+            device_counts = self.device_history.increment_many([t['device_id'] for t in transactions], now)
+            velocities = list(zip(user_counts.tolist(), device_counts.tolist()))
+        profiles = self.profiles.observe_many(transactions, now)
+        return np.stack([
+            self.extract_features(txn, now, velocity, profile)
+            for txn, velocity, profile in zip(transactions, velocities, profiles)
+        ])
+    
+    def record_outcome(self, transaction: Dict, is_fraud: bool):
+        """Feed a scoring decision back into stateful features"""
+        self.graph.record_outcome(transaction['user_id'], is_fraud)
+    
+    def snapshot_state(self) -> Tuple[Dict[str, np.ndarray], Dict]:
+        """Arrays and metadata for a feature-state snapshot (see features.snapshot)"""
+        arrays = {}
+        for name, component in self._snapshot_components():
+            arrays.update({f'{name}.{column}': array for column, array in component.to_arrays().items()})
+        return arrays, {'as_of': time.time(), 'windows': list(self.windows), 'buckets': self.user_history.buckets}
+
+    def restore_state(self, arrays: Dict[str, np.ndarray], meta: Dict) -> bool:
+        """Load a snapshot from ``snapshot_state``; False if it was taken with other windows"""
+        if tuple(meta['windows']) != self.windows or meta['buckets'] != self.user_history.buckets:
+            return False
+        for name, component in self._snapshot_components():
+            if f'{name}.keys' in arrays:
+                prefix = f'{name}.'
+                component.load_arrays({key[len(prefix):]: array for key, array in arrays.items() if key.startswith(prefix)})
+        return True
+
+    def _snapshot_components(self):
+        return (('user', self.user_history), ('device', self.device_history), ('profile', self.profiles))
+
+    def replay(self, user_id: str, device_id: str, timestamp: float, count: int):
+        """Count ``count`` past transactions at ``timestamp`` without extracting features"""
+        self.user_history.increment(user_id, now=timestamp, amount=count)
+        self.device_history.increment(device_id, now=timestamp, amount=count)
+
+    def velocity(self, user_id: str, device_id: str, now: Optional[float] = None) -> Dict[str, Dict[int, int]]:
+        """Current per-window counts for a user and a device"""
+        return {
+            'user': dict(zip(self.windows, self.user_history.get(user_id, now))),
+            'device': dict(zip(self.windows, self.device_history.get(device_id, now)))
+        }
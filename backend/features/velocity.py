@@ -0,0 +1,262 @@
+import numpy as np
+import time
+from typing import Dict, Optional, Sequence, Tuple
+
+from features.entity_store import EntityStore
+
+# Ring buckets are 16-bit and saturate rather than wrap
+COUNT_MAX = np.iinfo(np.uint16).max
+
+class SlidingWindowCounter:
+    """Per-key event counts over sliding time windows, kept in ring buckets.
+
+    Each window is split into ``buckets`` slots and a key's ring is only
+    advanced when the key is touched, so updates and lookups are O(1) in the
+    number of keys. Keys are interned into an ``EntityStore`` whose columns
+    hold the rings. Keys idle for ``idle_ttl`` seconds are evicted in
+    amortized sweeps, and ``max_keys`` puts a hard bound on memory.
+
+    Time is kept in whole seconds. A ring's head bucket is not stored: it is
+    always the bucket of the key's ``last_seen``. With 16-bit buckets the
+    default 3 windows x 12 buckets cost 88 bytes per key, plus the index.
+    """
+
+    def __init__(
+        self,
+        windows: Sequence[int] = (60, 3600, 86400),
+        buckets: int = 12,
+        idle_ttl: Optional[float] = None,
+        max_keys: Optional[int] = None,
+        capacity: int = 1024
+    ):
+        self.windows = tuple(windows)
+        self.buckets = buckets
+        # Integer where the window divides evenly, which keeps bucket arithmetic in ints
+        self.resolutions = [window // buckets if window % buckets == 0 else window / buckets for window in self.windows]
+        self.idle_ttl = idle_ttl or max(self.windows)
+        self.max_keys = max_keys
+
+        n_windows = len(self.windows)
+        self.store = EntityStore({
+            'counts': (np.uint16, (n_windows, buckets)),
+            'totals': (np.int32, (n_windows,)),
+            'last_seen': (np.uint32, ())     # epoch seconds of the latest event
+        }, capacity=capacity)
+        self._empty_ring = memoryview(np.zeros(buckets, dtype=np.uint16))
+        self._bind_views()
+
+        self._since_sweep = 0
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.store
+
+    def increment(self, key: str, now: Optional[float] = None, amount: int = 1) -> Tuple[int, ...]:
+        """Record ``amount`` events for ``key`` and return the per-window counts before it"""
+        now = int(time.time() if now is None else now)
+        slot = self._index.get(key)
+        if slot < 0:
+            slot = self._allocate(key, now)
+
+        counts, totals = self._counts, self._totals
+        n_buckets = self.buckets
+        last_seen = self._last_seen[slot]
+        if now > last_seen:
+            self._last_seen[slot] = now
+        row = slot * len(self.resolutions)
+        before = []
+        for resolution in self.resolutions:
+            bucket = int(now // resolution)
+            head = int(last_seen // resolution)
+            if bucket > head:
+                self._advance(row, head, bucket)
+                head = bucket
+            total = totals[row]
+            before.append(total)
+            if bucket > head - n_buckets:
+                # Late events older than the window are not counted
+                index = row * n_buckets + bucket % n_buckets
+                count = counts[index]
+                added = amount if count + amount <= COUNT_MAX else COUNT_MAX - count
+                counts[index] = count + added
+                totals[row] = total + added
+            row += 1
+
+        self._since_sweep += 1
+        if self._since_sweep >= 1024 and self._since_sweep >= len(self.store):
+            self.evict_idle(now)
+        return tuple(before)
+
+    def increment_many(self, keys: Sequence[str], now: Optional[float] = None) -> np.ndarray:
+        """Vectorized ``increment`` of one event per key at a single ``now``.
+
+        Returns an (N, windows) array of counts before each event, equal to
+        calling ``increment`` for the keys in order: repeats of a key within
+        the batch see the earlier ones.
+        """
+        now = int(time.time() if now is None else now)
+        n = len(keys)
+        if not n:
+            return np.zeros((0, len(self.windows)), dtype=np.int64)
+        slots = self.store.lookup(keys)
+        # Touch known keys first so allocating new ones cannot evict them; their
+        # ring heads are still the buckets of the previous last_seen
+        known = slots[slots >= 0]
+        previous = self.last_seen[known].astype(np.int64)
+        self.last_seen[known] = np.maximum(previous, now)
+        for i in np.flatnonzero(slots < 0).tolist():
+            slot = self.store.get(keys[i])
+            slots[i] = slot if slot >= 0 else self._allocate(keys[i], now)
+
+        unique, first, inverse, repeats = np.unique(slots, return_index=True, return_inverse=True, return_counts=True)
+        last_seen = self.last_seen[unique].astype(np.int64)
+        last_seen[np.searchsorted(unique, known)] = previous
+        # Occurrence number of each item among earlier items with the same key
+        order = np.argsort(inverse, kind='stable')
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n) - np.repeat(np.cumsum(repeats) - repeats, repeats)
+
+        n_buckets = self.buckets
+        positions = np.arange(n_buckets)
+        before = np.empty((n, len(self.windows)), dtype=np.int64)
+        for w, resolution in enumerate(self.resolutions):
+            bucket = int(now // resolution)
+            heads = (last_seen // resolution).astype(np.int64)
+            counts = self.counts[unique, w]
+
+            # Clear buckets that fall out of the window, as _advance does per key
+            steps = (positions[None, :] - heads[:, None]) % n_buckets
+            gap = (bucket - heads)[:, None]
+            expired = (gap >= n_buckets) | ((steps >= 1) & (steps <= gap))
+            counts[expired] = 0
+            heads = np.maximum(heads, bucket)
+            totals = counts.sum(axis=1, dtype=np.int64)
+
+            # Saturate as increment does, event by event
+            counted = bucket > heads - n_buckets
+            room = COUNT_MAX - counts[:, bucket % n_buckets].astype(np.int64)
+            before[:, w] = totals[inverse] + np.minimum(rank, room[inverse]) * counted[inverse]
+            added = np.minimum(repeats, room) * counted
+            counts[:, bucket % n_buckets] += added.astype(np.uint16)
+            totals += added
+
+            self.counts[unique, w] = counts
+            self.totals[unique, w] = totals
+
+        self._since_sweep += n
+        if self._since_sweep >= 1024 and self._since_sweep >= len(self.store):
+            self.evict_idle(now)
+        return before
+
+    def get(self, key: str, now: Optional[float] = None) -> Tuple[int, ...]:
+        """Per-window counts for ``key`` without recording an event"""
+        slot = self.store.get(key)
+        if slot < 0:
+            return (0,) * len(self.windows)
+
+        now = int(time.time() if now is None else now)
+        counts, totals = self._counts, self._totals
+        n_buckets = self.buckets
+        last_seen = self._last_seen[slot]
+        row = slot * len(self.resolutions)
+        result = []
+        for resolution in self.resolutions:
+            head = int(last_seen // resolution)
+            bucket = int(now // resolution)
+            if bucket - head >= n_buckets:
+                result.append(0)
+            else:
+                expired = 0
+                for step in range(head + 1, bucket + 1):
+                    expired += counts[row * n_buckets + step % n_buckets]
+                result.append(totals[row] - expired)
+            row += 1
+        return tuple(result)
+
+    def get_many(self, keys: Sequence[str], now: Optional[float] = None) -> np.ndarray:
+        """(N, windows) counts for many keys in one vectorized read; zeros for unknown keys"""
+        now = int(time.time() if now is None else now)
+        slots = self.store.lookup(keys)
+        rows = np.maximum(slots, 0)
+        n_buckets = self.buckets
+        last_seen = self.last_seen[rows].astype(np.int64)
+        result = np.zeros((len(slots), len(self.windows)), dtype=np.int64)
+        for w, resolution in enumerate(self.resolutions):
+            bucket = int(now // resolution)
+            heads = (last_seen // resolution).astype(np.int64)
+            # Ring position p holds bucket index head - (head - p) mod B; keep the ones still in the window
+            indices = heads[:, None] - (heads[:, None] - np.arange(n_buckets)[None, :]) % n_buckets
+            live = indices > np.maximum(heads, bucket)[:, None] - n_buckets
+            result[:, w] = (self.counts[rows, w] * live).sum(axis=1)
+        result[slots < 0] = 0
+        return result
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Free every key that has not been seen for ``idle_ttl`` seconds"""
+        now = time.time() if now is None else now
+        self._since_sweep = 0
+        live = self.store.live()
+        idle = live[self.last_seen[live] < now - self.idle_ttl]
+        for slot in idle.tolist():
+            self.store.remove(slot)
+        return len(idle)
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Compacted copy of the live keys and their rings, for snapshots"""
+        return self.store.to_arrays()
+
+    def load_arrays(self, arrays: Dict[str, np.ndarray]):
+        """Replace all state with arrays produced by ``to_arrays``"""
+        if arrays['counts'].dtype != self.counts.dtype:
+            # Snapshot from before buckets were 16-bit: saturate them, as increment would have
+            counts = np.minimum(arrays['counts'], COUNT_MAX)
+            arrays = {**arrays, 'counts': counts, 'totals': counts.sum(axis=-1)}
+        self.store.load_arrays(arrays)
+        self._bind_views()
+        self._since_sweep = 0
+
+    def _advance(self, row: int, head: int, bucket: int):
+        """Move a ring forward from ``head`` to ``bucket``, clearing buckets that fell out of the window"""
+        counts = self._counts
+        n_buckets = self.buckets
+        base = row * n_buckets
+        if bucket - head >= n_buckets:
+            counts[base:base + n_buckets] = self._empty_ring
+            self._totals[row] = 0
+        else:
+            expired = 0
+            for step in range(head + 1, bucket + 1):
+                index = base + step % n_buckets
+                expired += counts[index]
+                counts[index] = 0
+            self._totals[row] -= expired
+
+    def _allocate(self, key: str, now: int) -> int:
+        if self.max_keys is not None and len(self.store) >= self.max_keys:
+            if not self.evict_idle(now):
+                self._evict_oldest(max(1, self.max_keys // 100))
+
+        slot, _ = self.store.add(key)
+        if self.store.generation != self._generation:
+            self._bind_views()
+        self._last_seen[slot] = now
+        return slot
+
+    def _evict_oldest(self, n: int):
+        live = self.store.live()
+        n = min(n, len(live))
+        oldest = live[np.argpartition(self.last_seen[live], n - 1)[:n]]
+        for slot in oldest.tolist():
+            self.store.remove(slot)
+
+    def _bind_views(self):
+        """Column arrays (for vectorized sweeps) and flat memoryviews over the same memory for the hot path"""
+        store = self.store
+        self.counts, self.totals, self.last_seen = store['counts'], store['totals'], store['last_seen']
+        self._counts = memoryview(self.counts.reshape(-1))
+        self._totals = memoryview(self.totals.reshape(-1))
+        self._last_seen = memoryview(self.last_seen)
+        self._index = store.index
+        self._generation = store.generation
@@ -0,0 +1,100 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+class MicroBatcher:
+    """Coalesces concurrent single-item requests into one vectorized call.
+
+    Items submitted within ``window`` seconds of the first pending item (or
+    until ``max_batch`` items are pending) are handed to ``process`` together
+    and each caller's future is resolved with its own result. The window
+    adapts: it collapses towards zero while batches hold a single item (light
+    traffic gains nothing from waiting) and widens up to ``max_wait`` under
+    concurrency, never beyond what ``latency_slo`` leaves after processing time.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[List[Any]], Awaitable[List[Any]]],
+        max_batch: int = 64,
+        max_wait: float = 0.002,
+        latency_slo: float = 0.010
+    ):
+        self.process = process
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.latency_slo = latency_slo
+        self.window = max_wait
+
+        self._pending: List[Any] = []
+        self._futures: List[asyncio.Future] = []
+        self._timer: Optional[asyncio.Handle] = None
+        self._running = set()
+        self._process_time = 0.0
+
+        self.batches = 0
+        self.items = 0
+
+    async def submit(self, item: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append(item)
+        self._futures.append(future)
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            # A zero window still gathers everything submitted in the same loop iteration
+            if self.window > 0:
+                self._timer = loop.call_later(self.window, self._flush)
+            else:
+                self._timer = loop.call_soon(self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        items, futures = self._pending, self._futures
+        if not items:
+            return
+        self._pending, self._futures = [], []
+        task = asyncio.ensure_future(self._run(items, futures))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, items: List[Any], futures: List[asyncio.Future]):
+        started = time.perf_counter()
+        try:
+            results = await self.process(items)
+        except Exception as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for future, result in zip(futures, results):
+            if not future.done():
+                future.set_result(result)
+        self._adapt(len(items), time.perf_counter() - started)
+
+    def _adapt(self, size: int, elapsed: float):
+        self.batches += 1
+        self.items += size
+        self._process_time = 0.8 * self._process_time + 0.2 * elapsed if self.batches > 1 else elapsed
+
+        budget = max(0.0, min(self.max_wait, self.latency_slo - self._process_time))
+        if size == 1:
+            self.window *= 0.5
+            if self.window < 1e-5:
+                self.window = 0.0
+        else:
+            self.window = max(self.window * 1.5, 1e-4)
+        self.window = min(self.window, budget)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": True,
+            "batches": self.batches,
+            "avg_batch_size": self.items / self.batches if self.batches else 0.0,
+            "window_ms": self.window * 1000,
+            "process_ms_ewma": self._process_time * 1000
+        }
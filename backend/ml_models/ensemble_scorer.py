@@ -1,101 +1,200 @@
+import time
+
 import numpy as np
-from typing import Dict
+from typing import Callable, Dict, List, Optional, Sequence
+
+from features.transaction_features import FEATURE_INDEX
+from ml_models.rules import RuleEngine, rules as default_rules
+from utils.metrics import MODEL_SECONDS
+
+DEFAULT_WEIGHTS = {'xgboost': 0.4, 'isolation_forest': 0.25, 'rule_based': 0.20, 'graph_network': 0.15}
 
 class EnsembleScorer:
-    def __init__(self):
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        models: Optional[Dict[str, Callable[[np.ndarray], np.ndarray]]] = None,
+        version: str = "builtin",
+        rules: Optional[RuleEngine] = None
+    ):
+        # Sub-models operate on an (N, F) feature matrix and return N scores;
+        # loaded artifacts replace (or add to) the built-in formulas by name
         self.models = {
             'xgboost': self._xgboost_score,
             'isolation_forest': self._anomaly_score,
             'rule_based': self._rule_based_score,
             'graph_network': self._graph_score
         }
-    
+        # Plain-Python twins of the built-in formulas, for single rows
+        self.row_models = {
+            'xgboost': self._xgboost_row,
+            'isolation_forest': self._anomaly_row,
+            'rule_based': self._rule_based_row,
+            'graph_network': self._graph_row
+        }
+        for name in models or {}:
+            self.row_models.pop(name, None)
+        self.models.update(models or {})
+        self.version = version
+        self.rules = rules or default_rules
+        self._model_timers = {name: MODEL_SECONDS.labels(name) for name in self.models}
+
+        # Constants are built once instead of on every call
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        missing = [name for name in self.models if name not in self.weights]
+        if missing:
+            raise ValueError(f"No ensemble weight for models: {', '.join(missing)}")
+        self.weight_vector = np.array([self.weights[k] for k in self.models], dtype=np.float64)
+        self.mean_features = np.array([150, 3, 2, 1, 12, 0, 0, 0, 0], dtype=np.float64)
+        self.std_features = np.array([300, 2, 3, 2, 6, 1, 1, 1, 1], dtype=np.float64) + 1e-6
+        self._mean_row = self.mean_features.tolist()
+        self._std_row = self.std_features.tolist()
+        self._weight_row = self.weight_vector.tolist()
+
     def predict(self, features: np.ndarray) -> Dict:
         """Ensemble prediction from multiple models"""
-        scores = {}
-        
-        for model_name, model_func in self.models.items():
-            scores[model_name] = model_func(features)
-        
+        return self.predict_batch(features.reshape(1, -1))[0]
+
+    def predict_batch(self, features: np.ndarray) -> List[Dict]:
+        """Ensemble prediction for every row of an (N, F) feature matrix"""
+        if len(features) == 1:
+            # Array overhead would dominate a single row
+            return [self.predict_row(features[0])]
+        return self.combine(features, self.score_matrix(features))
+
+    def predict_row(self, features: np.ndarray) -> Dict:
+        """``predict_batch`` for one feature vector, with scalar formulas; same results"""
+        row = np.asarray(features, dtype=np.float32).tolist()
+        scores = []
+        for name, model in self.models.items():
+            started = time.perf_counter()
+            row_model = self.row_models.get(name)
+            scores.append(row_model(row) if row_model else float(model(self.prepare(features))[0]))
+            self._model_timers[name].observe(time.perf_counter() - started)
+        return self._combine_row(row, scores, list(self.models), self._weight_row)
+
+    def combine(self, features: np.ndarray, scores: np.ndarray, names: Optional[List[str]] = None) -> List[Dict]:
+        """Weighted ensemble over the score columns of ``names`` (default: every model).
+
+        When some models are missing (e.g. timed out) the remaining weights are
+        renormalized so the ensemble stays on the same 0..1 scale.
+        """
+        if names is None or len(names) == len(self.models):
+            names = list(self.models)
+            weights = self.weight_vector
+        else:
+            weights = np.array([self.weights[name] for name in names], dtype=np.float64)
+            weights = weights / weights.sum()
+        if scores.shape[0] == 1:
+            row = np.asarray(features, dtype=np.float32).reshape(-1).tolist()
+            return [self._combine_row(row, scores[0].tolist(), names, weights.tolist())]
+
         # Weighted ensemble
-        weights = {'xgboost': 0.4, 'isolation_forest': 0.25, 'rule_based': 0.20, 'graph_network': 0.15}
-        ensemble_score = sum(scores[k] * weights[k] for k in scores)
-        
+        ensemble_scores = np.zeros(scores.shape[0], dtype=np.float64)
+        for j, weight in enumerate(weights):
+            ensemble_scores += scores[:, j] * weight
+
         # Generate reasons
-        reasons = self._generate_reasons(features, scores)
-        
+        anomaly = scores[:, names.index('isolation_forest')] if 'isolation_forest' in names else np.zeros(scores.shape[0])
+        reasons = self._generate_reasons(features, anomaly)
+
+        return [{
+            'ensemble_score': float(ensemble_scores[i]),
+            'model_scores': dict(zip(names, scores[i].tolist())),
+            'reasons': reasons[i],
+            'fraud_probability': float(ensemble_scores[i])
+        } for i in range(len(ensemble_scores))]
+
+    def _combine_row(self, row: List[float], scores: List[float], names: List[str], weights: List[float]) -> Dict:
+        """``combine`` for a single row, in the same order of operations"""
+        ensemble_score = 0.0
+        for score, weight in zip(scores, weights):
+            ensemble_score += score * weight
+        anomaly = scores[names.index('isolation_forest')] if 'isolation_forest' in names else 0.0
         return {
-            'ensemble_score': float(ensemble_score),
-            'model_scores': {k: float(v) for k, v in scores.items()},
-            'reasons': reasons,
-            'fraud_probability': float(ensemble_score)
+            'ensemble_score': ensemble_score,
+            'model_scores': dict(zip(names, scores)),
+            'reasons': self.rules.current().reasons_row(row + [anomaly]),
+            'fraud_probability': ensemble_score
         }
-    
-    def _xgboost_score(self, features: np.ndarray) -> float:
+
+    def score_matrix(self, features: np.ndarray) -> np.ndarray:
+        """Run every sub-model over the batch, returning an (N, n_models) score matrix"""
+        features = self.prepare(features)
+        scores = np.empty((features.shape[0], len(self.models)), dtype=np.float64)
+        for j, name in enumerate(self.models):
+            scores[:, j] = self.run_model(name, features)
+        return scores
+
+    def run_model(self, name: str, features: np.ndarray) -> np.ndarray:
+        """One sub-model over a prepared matrix, timed per model"""
+        started = time.perf_counter()
+        scores = self.models[name](features)
+        self._model_timers[name].observe(time.perf_counter() - started)
+        return scores
+
+    @staticmethod
+    def prepare(features: np.ndarray) -> np.ndarray:
+        """Sub-model input: a 2-D matrix of float32 features widened once to float64"""
+        features = np.asarray(features, dtype=np.float32).astype(np.float64)
+        if features.ndim == 1:
+            features = features.reshape(1, -1)
+        return features
+
+    def _xgboost_score(self, features: np.ndarray) -> np.ndarray:
         """Simulated XGBoost prediction"""
-        amount_risk = min(features[0] / 5000, 1.0)
-        velocity_risk = min(features[2] / 5, 1.0)
+        amount_risk = np.minimum(features[:, FEATURE_INDEX['amount']] / 5000.0, 1.0)
+        velocity_risk = np.minimum(features[:, FEATURE_INDEX['user_velocity']] / 5.0, 1.0)
         return amount_risk * 0.6 + velocity_risk * 0.4
-    
-    def _anomaly_score(self, features: np.ndarray) -> float:
+
+    def _anomaly_score(self, features: np.ndarray) -> np.ndarray:
         """Simulated anomaly detection"""
-        mean_features = np.array([150, 3, 2, 1, 12, 0, 0, 0, 0])
-        std_features = np.array([300, 2, 3, 2, 6, 1, 1, 1, 1])
-        
-        z_scores = np.abs((features - mean_features) / (std_features + 1e-6))
-        return min(np.mean(z_scores) / 4, 1.0)
-    
-    def _rule_based_score(self, features: np.ndarray) -> float:
-        """Rule-based risk scoring"""
-        risk = 0.0
-        
-        # High amount
-        if features[0] > 5000:
-            risk += 0.3
-        
-        # High velocity
-        if features[2] > 5:
-            risk += 0.4
-        
-        # Night transaction
-        if features[5] == 1:
-            risk += 0.2
-        
-        # High risk country
-        if features[8] == 1:
-            risk += 0.3
-        
-        return min(risk, 1.0)
-    
-    def _graph_score(self, features: np.ndarray) -> float:
-        """Network-based risk"""
-        device_count = features[3]
-        if device_count > 5:
-            return 0.8
-        elif device_count > 3:
-            return 0.5
-        return 0.2
-    
-    def _generate_reasons(self, features: np.ndarray, scores: Dict) -> list:
-        """Generate explainable reasons"""
-        reasons = []
-        
-        if features[0] > 2000:
-            reasons.append(f"High transaction amount: ${features[0]:.2f}")
-        
-        if features[2] > 3:
-            reasons.append(f"High velocity: {int(features[2])} recent transactions")
-        
-        if features[5] == 1:
-            reasons.append("Unusual time: Transaction during night hours")
-        
-        if features[8] == 1:
-            reasons.append("High-risk country detected")
+        z_scores = np.abs((features[:, :9] - self.mean_features) / self.std_features)
+        return np.minimum(z_scores.mean(axis=1) / 4, 1.0)
+
+    def _rule_based_score(self, features: np.ndarray) -> np.ndarray:
+        """Rule-based risk scoring (see ml_models.rules)"""
+        return self.rules.current().score(features)
+
+    def _graph_score(self, features: np.ndarray) -> np.ndarray:
+        """Network-based risk from device velocity and the user/device/IP graph"""
+        device_count = features[:, FEATURE_INDEX['device_velocity']]
+        velocity_risk = np.select([device_count > 5, device_count > 3], [0.8, 0.5], default=0.2)
         
-        if features[3] > 3:
-            reasons.append(f"Multiple devices: {int(features[3])} devices used")
+        # Device shared by several distinct users (account takeover / mule pattern)
+        users_per_device = features[:, FEATURE_INDEX['graph_users_per_device']]
+        shared_risk = np.select([users_per_device >= 5, users_per_device >= 3], [0.9, 0.7], default=0.0)
         
-        if scores['isolation_forest'] > 0.7:
-            reasons.append("Anomalous transaction pattern detected")
+        # Linked to a component with a high share of flagged activity
+        component_size = features[:, FEATURE_INDEX['graph_component_size']]
+        density = features[:, FEATURE_INDEX['graph_fraud_density']]
+        ring_risk = np.where((component_size > 2) & (density >= 0.2), np.minimum(0.5 + density / 2, 1.0), 0.0)
         
-        return reasons if reasons else ["Normal transaction pattern"]
\ No newline at end of file
+        return np.maximum(velocity_risk, np.maximum(shared_risk, ring_risk))
+
+    def _xgboost_row(self, row: Sequence[float]) -> float:
+        return min(row[FEATURE_INDEX['amount']] / 5000.0, 1.0) * 0.6 + min(row[FEATURE_INDEX['user_velocity']] / 5.0, 1.0) * 0.4
+
+    def _anomaly_row(self, row: Sequence[float]) -> float:
+        z = [abs((value - mean) / std) for value, mean, std in zip(row, self._mean_row, self._std_row)]
+        # Summed in the pairwise order NumPy's mean uses for nine values, so both paths agree to the bit
+        total = (((z[0] + z[1]) + (z[2] + z[3])) + ((z[4] + z[5]) + (z[6] + z[7]))) + z[8]
+        return min(total / 9 / 4, 1.0)
+
+    def _rule_based_row(self, row: Sequence[float]) -> float:
+        return self.rules.current().score_row(row)
+
+    def _graph_row(self, row: Sequence[float]) -> float:
+        device_count = row[FEATURE_INDEX['device_velocity']]
+        velocity_risk = 0.8 if device_count > 5 else 0.5 if device_count > 3 else 0.2
+        users_per_device = row[FEATURE_INDEX['graph_users_per_device']]
+        shared_risk = 0.9 if users_per_device >= 5 else 0.7 if users_per_device >= 3 else 0.0
+        component_size = row[FEATURE_INDEX['graph_component_size']]
+        density = row[FEATURE_INDEX['graph_fraud_density']]
+        ring_risk = min(0.5 + density / 2, 1.0) if component_size > 2 and density >= 0.2 else 0.0
+        return max(velocity_risk, shared_risk, ring_risk)
+
+    def _generate_reasons(self, features: np.ndarray, anomaly: np.ndarray) -> List[list]:
+        """Generate explainable reasons for every row"""
+        features = np.asarray(features, dtype=np.float32).reshape(anomaly.shape[0], -1)
+        return self.rules.current().reasons(features, anomaly)
@@ -0,0 +1,162 @@
+import asyncio
+import concurrent.futures
+import logging
+from collections import defaultdict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from ml_models.ensemble_scorer import EnsembleScorer
+from ml_models.registry import ModelRegistry, load_scorer
+from utils.metrics import PARTIAL_ENSEMBLES
+
+logger = logging.getLogger(__name__)
+
+class ScoringOverloaded(Exception):
+    """More scoring calls are pending than the executor admits, or no model answered in time"""
+
+# Per-process scorer for the process pool, loaded once by the pool initializer
+_child_scorer: Optional[EnsembleScorer] = None
+
+def _init_child(model_dir: Optional[str]):
+    global _child_scorer
+    _child_scorer = load_scorer(model_dir) if model_dir else EnsembleScorer()
+
+def _run_child_model(name: str, features: np.ndarray) -> np.ndarray:
+    return _child_scorer.run_model(name, features)
+
+class ScoringExecutor:
+    """Runs the registry's active scorer inline, on a thread pool or on a process pool.
+
+    ``inline`` scores on the event loop (cheap simulated models). ``thread``
+    suits native models that release the GIL; ``process`` gives each child its
+    own pre-loaded scorer. Off-loop, every sub-model runs as its own pool call.
+    With ``allow_partial``, a model that misses ``model_timeout`` (or fails) is
+    left out and the remaining weights are renormalized; every such batch is
+    counted in ``fraud_partial_ensemble``. Otherwise a model that misses
+    ``model_timeout`` fails the whole batch with ``ScoringOverloaded``.
+    At most ``max_pending`` batches may be in flight, counted until their pool
+    calls have actually finished (a timed-out call keeps its worker busy);
+    beyond that ``ScoringOverloaded`` is raised instead of queueing. When
+    the registry swaps models, the process pool is replaced so new children
+    load the new version while old ones finish their in-flight calls.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        mode: str = "inline",
+        workers: Optional[int] = None,
+        max_pending: int = 256,
+        model_timeout: float = 0.05,
+        allow_partial: bool = False
+    ):
+        self.registry = registry
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.model_timeout = model_timeout
+        self.allow_partial = allow_partial
+
+        self.pool: Optional[Executor] = None
+        if mode == "thread":
+            self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scoring")
+        elif mode == "process":
+            self.pool = self._process_pool()
+            registry.listeners.append(self._recycle_pool)
+        elif mode != "inline":
+            raise ValueError(f"Unknown scoring executor mode: {mode}")
+
+        self.pending = 0
+        self.rejected = 0
+        self.partial = 0
+        self.timeouts = defaultdict(int)
+        self.errors = defaultdict(int)
+
+    def _process_pool(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(max_workers=self.workers, initializer=_init_child, initargs=(self.registry.model_dir,))
+
+    def _recycle_pool(self, scorer: EnsembleScorer):
+        old, self.pool = self.pool, self._process_pool()
+        old.shutdown(wait=False)
+
+    async def predict_batch(self, features: np.ndarray) -> List[Dict]:
+        # One scorer for the whole call, even if the registry swaps mid-flight
+        scorer = self.registry.scorer
+        if self.pool is None:
+            return scorer.predict_batch(features)
+
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ScoringOverloaded(f"{self.pending} scoring batches already pending")
+        features = scorer.prepare(features)
+        names = list(scorer.models)
+        calls = [self._submit(scorer, name, features) for name in names]
+        futures = [asyncio.wrap_future(call) for call in calls]
+
+        # The batch stays pending until its last pool call is done, even after it timed out
+        self.pending += 1
+        outstanding = len(futures)
+
+        def finished(future: asyncio.Future):
+            nonlocal outstanding
+            if not future.cancelled():
+                # Mark retrieved so late failures do not warn
+                future.exception()
+            outstanding -= 1
+            if not outstanding:
+                self.pending -= 1
+        for future in futures:
+            future.add_done_callback(finished)
+
+        await asyncio.wait(futures, timeout=self.model_timeout)
+        late = [name for name, call, future in zip(names, calls, futures) if not future.done()]
+        for name, call, future in zip(names, calls, futures):
+            if not future.done():
+                # Drops the call if it has not started; a running one finishes in the background
+                call.cancel()
+                self.timeouts[name] += 1
+        if late and not self.allow_partial:
+            raise ScoringOverloaded(f"Models {', '.join(late)} did not answer within {self.model_timeout}s")
+
+        answered, columns = [], []
+        for name, call, future in zip(names, calls, futures):
+            if name in late:
+                PARTIAL_ENSEMBLES.labels(name).inc()
+            elif future.cancelled() or future.exception() is not None:
+                self.errors[name] += 1
+                logger.error("Model %s failed: %r", name, None if future.cancelled() else future.exception())
+                if not self.allow_partial:
+                    raise future.exception() or ScoringOverloaded(f"Model {name} was cancelled")
+                PARTIAL_ENSEMBLES.labels(name).inc()
+            else:
+                answered.append(name)
+                columns.append(future.result())
+        if not answered:
+            raise ScoringOverloaded("No model answered within the timeout")
+        if len(answered) < len(names):
+            self.partial += 1
+        return scorer.combine(features, np.column_stack(columns), answered)
+
+    def _submit(self, scorer: EnsembleScorer, name: str, features: np.ndarray) -> concurrent.futures.Future:
+        if self.mode == "process":
+            return self.pool.submit(_run_child_model, name, features)
+        return self.pool.submit(scorer.run_model, name, features)
+
+    def shutdown(self):
+        if self.pool is not None:
+            # Timed-out calls may still be running; do not wait for them
+            self.pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return {
+            "mode": self.mode,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "rejected": self.rejected,
+            "allow_partial": self.allow_partial,
+            "partial": self.partial,
+            "timeouts": dict(self.timeouts),
+            "errors": dict(self.errors)
+        }
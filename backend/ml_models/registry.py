@@ -0,0 +1,155 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from features.transaction_features import FEATURE_INDEX
+from ml_models.ensemble_scorer import EnsembleScorer
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-x))
+
+def _load_linear(path: str) -> Callable[[np.ndarray], np.ndarray]:
+    """``.npy`` vector [bias, w1..wF] for a logistic model, memory-mapped read-only"""
+    coef = np.load(path, mmap_mode='r')
+    return lambda features: _sigmoid(features @ coef[1:] + coef[0])
+
+def _load_xgboost(path: str) -> Callable[[np.ndarray], np.ndarray]:
+    # XGBoost copies the model into its own buffers, so this one is per worker
+    import xgboost as xgb
+    booster = xgb.Booster()
+    booster.load_model(path)
+    return lambda features: booster.inplace_predict(features)
+
+def _load_sklearn(path: str) -> Callable[[np.ndarray], np.ndarray]:
+    import joblib
+    # NumPy arrays inside the estimator (tree nodes, thresholds) stay memory-mapped
+    model = joblib.load(path, mmap_mode='r')
+    if hasattr(model, 'predict_proba'):
+        return lambda features: model.predict_proba(features)[:, 1]
+    # IsolationForest: score_samples is the negated anomaly score in (0, 1]
+    return lambda features: np.clip(-model.score_samples(features), 0.0, 1.0)
+
+def _load_torch(path: str) -> Callable[[np.ndarray], np.ndarray]:
+    import torch
+    module = torch.load(path, mmap=True, weights_only=False)
+    module.eval()
+
+    def predict(features: np.ndarray) -> np.ndarray:
+        with torch.inference_mode():
+            logits = module(torch.from_numpy(np.ascontiguousarray(features, dtype=np.float32)))
+        return torch.sigmoid(logits).reshape(-1).numpy().astype(np.float64)
+    return predict
+
+LOADERS = {
+    'linear': _load_linear,
+    'xgboost': _load_xgboost,
+    'sklearn': _load_sklearn,
+    'torch': _load_torch
+}
+
+def _select(predict: Callable[[np.ndarray], np.ndarray], columns: List[int]) -> Callable[[np.ndarray], np.ndarray]:
+    return lambda features: predict(features[:, columns])
+
+def load_scorer(model_dir: str) -> EnsembleScorer:
+    """Build a scorer from ``model_dir/manifest.json``.
+
+    Manifest layout::
+
+        {"version": "2024-06-01",
+         "weights": {"xgboost": 0.4, "isolation_forest": 0.25, ...},
+         "models": {"xgboost": {"format": "xgboost", "path": "xgb-2024-06-01.ubj",
+                                "features": ["amount", "user_velocity", ...]}}}
+
+    Models without an artifact keep their built-in formula.
+    """
+    with open(os.path.join(model_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    models = {}
+    for name, spec in manifest.get('models', {}).items():
+        predict = LOADERS[spec['format']](os.path.join(model_dir, spec['path']))
+        if spec.get('features'):
+            predict = _select(predict, [FEATURE_INDEX[feature] for feature in spec['features']])
+        models[name] = predict
+
+    return EnsembleScorer(
+        weights=manifest.get('weights'),
+        models=models,
+        version=str(manifest.get('version', 'unversioned'))
+    )
+
+class ModelRegistry:
+    """Holds the active ``EnsembleScorer`` and swaps in new model versions.
+
+    Artifacts are memory-mapped read-only, so every worker on a host shares
+    the page cache copy. A new version is published by writing its artifacts
+    under new file names and then replacing ``manifest.json`` (write + rename);
+    the registry notices the manifest change, loads the new scorer off the
+    event loop and swaps a single reference. Requests already scoring keep the
+    scorer they started with, so nothing pauses. Files of a live version must
+    never be rewritten in place.
+    """
+
+    def __init__(self, model_dir: Optional[str] = None, poll_interval: float = 10.0):
+        self.model_dir = model_dir
+        self.poll_interval = poll_interval
+        self.scorer = EnsembleScorer()
+        self.listeners: List[Callable[[EnsembleScorer], None]] = []
+        self._manifest_mtime: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self.failed_loads = 0
+
+    async def load(self) -> bool:
+        """Load the manifest's models if it changed since the last load; True when swapped"""
+        if not self.model_dir:
+            return False
+        mtime = os.stat(os.path.join(self.model_dir, MANIFEST)).st_mtime_ns
+        if mtime == self._manifest_mtime:
+            return False
+        scorer = await asyncio.to_thread(load_scorer, self.model_dir)
+        self.scorer = scorer
+        self._manifest_mtime = mtime
+        for listener in self.listeners:
+            listener(scorer)
+        logger.info("Activated model version %s", scorer.version)
+        return True
+
+    async def start(self):
+        await self.load()
+        if self.model_dir:
+            self._task = asyncio.create_task(self._watch())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.load()
+            except Exception:
+                # Keep serving the current version
+                self.failed_loads += 1
+                logger.exception("Loading models from %s failed", self.model_dir)
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.scorer.version,
+            "models": list(self.scorer.models),
+            "weights": self.scorer.weights,
+            "failed_loads": self.failed_loads
+        }
@@ -0,0 +1,291 @@
+"""Declarative scoring rules compiled to vectorized NumPy predicates.
+
+Rules live in a JSON file (``RULES_PATH``, default: the bundled ``rules.json``)::
+
+    {"version": "2024-06-01",
+     "default_reason": "Normal transaction pattern",
+     "lists": {"high_risk_countries": ["NG", "RU"]},
+     "rules": [{"name": "spend_outlier",
+                "when": {"all": [{"feature": "amount_zscore", "op": ">", "value": 3},
+                                 {"feature": "amount_to_mean", "op": ">", "value": 5}]},
+                "weight": 0.3,
+                "reason": "Unusual amount for this user: {amount_to_mean:.0f}x their average"}]}
+
+Conditions name features from ``FEATURE_NAMES`` (plus ``anomaly_score`` in
+reason-only rules) and combine with ``all``/``any``/``not``; leaf operators
+are comparisons and ``in``, whose values are inline or a numeric list named
+with ``{"list": "<name>"}``. Features are numeric, so string lists cannot
+appear in conditions: ``high_risk_countries`` is read by feature extraction
+to compute the ``high_risk_country`` flag. ``weight`` adds to the rule-based model score
+(capped at 1) and ``reason`` is a format template over the row's features.
+Each file is compiled once into closures over whole batches, plus per-row
+twins over a list of values for single transactions. Edits are picked
+up by checking the file's mtime at most every ``poll_interval`` seconds in
+whichever process uses the rules; a file that fails to compile is logged and
+the previous rules stay active. Publish with write + rename.
+"""
+import json
+import logging
+import operator
+import os
+import string
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from features.transaction_features import FEATURE_INDEX, FEATURE_NAMES
+from utils.metrics import RULE_SECONDS_TOTAL
+
+logger = logging.getLogger(__name__)
+
+BUNDLED_RULES = os.path.join(os.path.dirname(__file__), "rules.json")
+
+# Reason-only rules can also look at the isolation-forest score, appended as an extra column
+COLUMNS = dict(FEATURE_INDEX, anomaly_score=len(FEATURE_NAMES))
+
+OPS = {
+    '>': np.greater, '>=': np.greater_equal, '<': np.less, '<=': np.less_equal,
+    '==': np.equal, '!=': np.not_equal
+}
+
+ROW_OPS = {
+    '>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le,
+    '==': operator.eq, '!=': operator.ne
+}
+
+Predicate = Callable[[np.ndarray], np.ndarray]
+RowPredicate = Callable[[Sequence[float]], bool]
+
+def compile_condition(condition: Dict, used: set, lists: Dict[str, list]) -> Predicate:
+    """Closure computing the condition's boolean mask over an (N, columns) matrix"""
+    if 'all' in condition or 'any' in condition:
+        combine = np.logical_and if 'all' in condition else np.logical_or
+        parts = [compile_condition(part, used, lists) for part in condition['all' if 'all' in condition else 'any']]
+        if not parts:
+            raise ValueError("Empty all/any")
+
+        def combined(matrix: np.ndarray) -> np.ndarray:
+            mask = parts[0](matrix)
+            for part in parts[1:]:
+                mask = combine(mask, part(matrix))
+            return mask
+        return combined
+    if 'not' in condition:
+        inner = compile_condition(condition['not'], used, lists)
+        return lambda matrix: ~inner(matrix)
+
+    feature = condition['feature']
+    if feature not in COLUMNS:
+        raise ValueError(f"Unknown feature {feature!r}")
+    used.add(feature)
+    column = COLUMNS[feature]
+    if condition['op'] == 'in':
+        values = condition['value']
+        if isinstance(values, dict):
+            values = lists[values['list']]
+        try:
+            values = np.asarray(values, dtype=np.float64)
+        except ValueError:
+            raise ValueError(f"{feature!r} is numeric; 'in' needs numeric values") from None
+        return lambda matrix: np.isin(matrix[:, column], values)
+    op = OPS[condition['op']]
+    value = float(condition['value'])
+    return lambda matrix: op(matrix[:, column], value)
+
+def compile_row_condition(condition: Dict, lists: Dict[str, list]) -> RowPredicate:
+    """Per-row twin of ``compile_condition`` (which validates the spec) over one row's values"""
+    if 'all' in condition or 'any' in condition:
+        every = 'all' in condition
+        parts = [compile_row_condition(part, lists) for part in condition['all' if every else 'any']]
+
+        def combined(row: Sequence[float]) -> bool:
+            for part in parts:
+                if part(row) != every:
+                    return not every
+            return every
+        return combined
+    if 'not' in condition:
+        inner = compile_row_condition(condition['not'], lists)
+        return lambda row: not inner(row)
+
+    column = COLUMNS[condition['feature']]
+    if condition['op'] == 'in':
+        values = condition['value']
+        if isinstance(values, dict):
+            values = lists[values['list']]
+        values = frozenset(float(value) for value in values)
+        return lambda row: row[column] in values
+    op = ROW_OPS[condition['op']]
+    value = float(condition['value'])
+    return lambda row: op(row[column], value)
+
+class Rule:
+    def __init__(self, spec: Dict, lists: Dict[str, list]):
+        self.name = spec['name']
+        self.weight = float(spec.get('weight', 0.0))
+        self.reason = spec.get('reason')
+        used = set()
+        self.predicate = compile_condition(spec['when'], used, lists)
+        self.row_predicate = compile_row_condition(spec['when'], lists)
+        if self.weight and 'anomaly_score' in used:
+            raise ValueError(f"Rule {self.name!r}: anomaly_score is only available to reason-only rules")
+        # Reason template with named fields rewritten as positional ones, plus their columns
+        self.template, self.columns = None, []
+        if self.reason is not None:
+            template = ''
+            for literal, field, format_spec, conversion in string.Formatter().parse(self.reason):
+                template += literal.replace('{', '{{').replace('}', '}}')
+                if field is None:
+                    continue
+                if field not in COLUMNS:
+                    raise ValueError(f"Rule {self.name!r}: unknown field {field!r} in reason")
+                template += '{%d%s%s}' % (
+                    len(self.columns), f'!{conversion}' if conversion else '', f':{format_spec}' if format_spec else ''
+                )
+                self.columns.append(COLUMNS[field])
+            self.template = template
+        self.timer = RULE_SECONDS_TOTAL.labels(self.name)
+        self.seconds = 0.0
+        self.calls = 0
+
+    def evaluate(self, matrix: np.ndarray) -> np.ndarray:
+        started = time.perf_counter()
+        mask = self.predicate(matrix)
+        elapsed = time.perf_counter() - started
+        self.timer.inc(elapsed)
+        self.seconds += elapsed
+        self.calls += 1
+        return mask
+
+class RuleSet:
+    """One compiled rule file"""
+
+    def __init__(self, spec: Dict):
+        self.version = str(spec.get('version', 'unversioned'))
+        self.default_reason = spec.get('default_reason', "Normal transaction pattern")
+        self.lists = {name: list(values) for name, values in spec.get('lists', {}).items()}
+        self.rules = [Rule(rule, self.lists) for rule in spec['rules']]
+        names = [rule.name for rule in self.rules]
+        if len(set(names)) != len(names):
+            raise ValueError("Rule names must be unique")
+        self.scoring = [rule for rule in self.rules if rule.weight]
+        self.explaining = [rule for rule in self.rules if rule.reason is not None]
+
+    def score(self, features: np.ndarray) -> np.ndarray:
+        """Sum of the weights of matching rules, capped at 1"""
+        risk = np.zeros(features.shape[0], dtype=np.float64)
+        for rule in self.scoring:
+            risk += rule.evaluate(features) * rule.weight
+        return np.minimum(risk, 1.0)
+
+    def score_row(self, row: Sequence[float]) -> float:
+        """``score`` for one row of feature values.
+
+        Not timed per rule: a row predicate costs less than the timer would.
+        """
+        risk = 0.0
+        for rule in self.scoring:
+            if rule.row_predicate(row):
+                risk += rule.weight
+        return min(risk, 1.0)
+
+    def reasons(self, features: np.ndarray, anomaly: np.ndarray) -> List[list]:
+        """Reasons of matching rules per row, in file order"""
+        matrix = np.column_stack([features, anomaly])
+        if not self.explaining:
+            return [[self.default_reason] for _ in range(len(matrix))]
+        masks = np.column_stack([rule.evaluate(matrix) for rule in self.explaining])
+
+        # Format per rule over the rows it matched; rows collect reasons in file order
+        reasons = [None] * len(matrix)
+        for j in np.flatnonzero(masks.any(axis=0)).tolist():
+            rule = self.explaining[j]
+            rows = np.flatnonzero(masks[:, j]).tolist()
+            if rule.columns:
+                values = [matrix[rows, column].tolist() for column in rule.columns]
+                texts = [rule.template.format(*row) for row in zip(*values)]
+            else:
+                texts = [rule.template] * len(rows)
+            for row, text in zip(rows, texts):
+                if reasons[row] is None:
+                    reasons[row] = [text]
+                else:
+                    reasons[row].append(text)
+        return [row if row is not None else [self.default_reason] for row in reasons]
+
+    def reasons_row(self, row: Sequence[float]) -> list:
+        """``reasons`` for one row of feature values followed by its anomaly score"""
+        reasons = [
+            rule.template.format(*[row[column] for column in rule.columns]) if rule.columns else rule.template
+            for rule in self.explaining if rule.row_predicate(row)
+        ]
+        return reasons or [self.default_reason]
+
+    def stats(self) -> List[Dict]:
+        """Cumulative evaluation cost per rule, most expensive first"""
+        return sorted((
+            {"rule": rule.name, "calls": rule.calls, "seconds": round(rule.seconds, 6),
+             "mean_us": round(1e6 * rule.seconds / rule.calls, 2) if rule.calls else 0.0}
+            for rule in self.rules
+        ), key=lambda s: s["seconds"], reverse=True)
+
+def load_rules(path: str) -> RuleSet:
+    with open(path) as f:
+        return RuleSet(json.load(f))
+
+class RuleEngine:
+    """The active ``RuleSet`` for ``path``, recompiled when the file changes"""
+
+    def __init__(self, path: str = BUNDLED_RULES, poll_interval: float = 5.0):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.listeners: List[Callable[[RuleSet], None]] = []
+        self.failed_loads = 0
+        self._mtime = os.stat(path).st_mtime_ns
+        self._checked = time.monotonic()
+        self.rules = load_rules(path)
+
+    def current(self) -> RuleSet:
+        """Active rules; checks for a new file at most every ``poll_interval`` seconds"""
+        now = time.monotonic()
+        if now - self._checked >= self.poll_interval:
+            self._checked = now
+            self.reload()
+        return self.rules
+
+    def reload(self) -> bool:
+        """Compile the file if it changed; True when the new rules were swapped in"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            logger.exception("Rules file %s is not readable", self.path)
+            return False
+        if mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            rules = load_rules(self.path)
+        except (OSError, ValueError, KeyError, TypeError):
+            # Keep serving the current rules until the file changes again
+            self.failed_loads += 1
+            logger.exception("Loading rules from %s failed", self.path)
+            return False
+        self.rules = rules
+        for listener in self.listeners:
+            listener(rules)
+        logger.info("Activated rules version %s", rules.version)
+        return True
+
+    def stats(self) -> Dict:
+        return {
+            "version": self.rules.version,
+            "path": self.path,
+            "failed_loads": self.failed_loads,
+            "rules": self.rules.stats()
+        }
+
+rules = RuleEngine(
+    os.getenv("RULES_PATH", BUNDLED_RULES),
+    poll_interval=float(os.getenv("RULES_POLL_INTERVAL", "5"))
+)
@@ -0,0 +1,187 @@
+"""Bulk offline ingest: score transactions in-process and load them without HTTP.
+
+Reads JSONL, CSV or Parquet, scores each chunk with ``TransactionFeatureEngine``
+and the ensemble (models from MODEL_DIR when set), and writes transactions and
+alerts with COPY on Postgres (multi-row INSERT elsewhere). Rollups are updated
+in the same database transaction as each chunk. Run from ``backend/``:
+
+    python -m scripts.bulk_ingest history.jsonl --chunk-size 20000
+
+Rows may carry ``created_at`` (ISO 8601 or epoch seconds); it is used both as
+the stored timestamp and as the clock for velocity features, so input should
+be in time order. Rows without it are stamped with the current time.
+The stored id is ``transaction_id`` as in the API, else ``id``, else a new
+UUID; rows whose id is already stored are skipped.
+Feature state is bounded by FEATURE_MAX_KEYS and GRAPH_MAX_NODES, as in the API.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from api.schemas import TransactionRequest, build_records
+from database.connection import engine, init_db
+from database.models import Transaction, Alert
+from database.partitions import ensure_partitions
+from database.rollups import rollups
+from database.writer import insert_scored, claim_transaction_ids
+from features.transaction_features import TransactionFeatureEngine, HIGH_RISK_COUNTRIES
+from ml_models.ensemble_scorer import EnsembleScorer
+from ml_models.rules import rules
+from ml_models.registry import load_scorer
+
+TRANSACTION_COLUMNS = [c.name for c in Transaction.__table__.columns if c.name not in ('reviewed', 'actual_fraud')]
+ALERT_COLUMNS = [c.name for c in Alert.__table__.columns if c.name != 'id']
+JSON_COLUMNS = {'model_scores', 'reasons', 'details'}
+
+def read_jsonl(path: str) -> Iterator[Dict]:
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def read_csv(path: str) -> Iterator[Dict]:
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            row['amount'] = float(row['amount'])
+            yield row
+
+def read_parquet(path: str, batch_size: int = 65536) -> Iterator[Dict]:
+    import pyarrow.parquet as pq
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+        yield from batch.to_pylist()
+
+READERS = {'jsonl': read_jsonl, 'csv': read_csv, 'parquet': read_parquet}
+EXTENSIONS = {'.jsonl': 'jsonl', '.json': 'jsonl', '.csv': 'csv', '.parquet': 'parquet'}
+
+def chunked(rows: Iterator[Dict], size: int) -> Iterator[List[Dict]]:
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def parse_timestamp(value) -> datetime:
+    if value is None or value == '':
+        return datetime.utcnow()
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value)
+    try:
+        return datetime.utcfromtimestamp(float(value))
+    except ValueError:
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+
+class Ingestor:
+    def __init__(self, scorer: EnsembleScorer):
+        # Same state bounds as the API, so a long history cannot grow the counters without limit
+        self.feature_engine = TransactionFeatureEngine(
+            max_keys=int(os.getenv("FEATURE_MAX_KEYS", "10000000")) or None,
+            high_risk_countries=rules.rules.lists.get('high_risk_countries', HIGH_RISK_COUNTRIES),
+            graph_max_nodes=int(os.getenv("GRAPH_MAX_NODES", "5000000")) or None
+        )
+        self.scorer = scorer
+
+    def score_chunk(self, chunk: List[Dict]) -> Tuple[List[Dict], List[Optional[Dict]]]:
+        """Features and scores for one chunk; returns transaction and alert rows"""
+        requests = [TransactionRequest(**row) for row in chunk]
+        timestamps = [parse_timestamp(row.get('created_at')) for row in chunk]
+
+        # created_at drives the velocity clock, same as the live path's time.time()
+        features = np.stack([
+            self.feature_engine.extract_features(req.dict(), now=(ts - datetime(1970, 1, 1)).total_seconds())
+            for req, ts in zip(requests, timestamps)
+        ])
+        results = self.scorer.predict_batch(features)
+
+        transaction_rows, alert_rows = [], []
+        for row, req, result, timestamp in zip(chunk, requests, results, timestamps):
+            transaction_row, alert_row, _ = build_records(req, req.transaction_id or row.get('id') or str(uuid.uuid4()), result, timestamp)
+            self.feature_engine.record_outcome(transaction_row, transaction_row['is_fraud'])
+            transaction_rows.append(transaction_row)
+            alert_rows.append(alert_row)
+        return transaction_rows, alert_rows
+
+async def copy_rows(conn, table: str, columns: List[str], rows: List[Dict]):
+    """COPY rows into ``table`` over the connection's asyncpg driver"""
+    records = [
+        tuple(json.dumps(row[c], default=str) if c in JSON_COLUMNS else row[c] for c in columns)
+        for row in rows
+    ]
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(table, records=records, columns=columns)
+
+async def write_chunk(transaction_rows: List[Dict], alert_rows: List[Optional[Dict]]):
+    """Load one chunk and its rollup deltas in a single transaction"""
+    alerts = [a for a in alert_rows if a is not None]
+    async with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            timestamps = [row['created_at'] for row in transaction_rows]
+            await ensure_partitions(conn, min(timestamps), max(timestamps))
+            transaction_rows, alerts = await claim_transaction_ids(conn, transaction_rows, alerts)
+            if transaction_rows:
+                await copy_rows(conn, Transaction.__tablename__, TRANSACTION_COLUMNS, transaction_rows)
+            if alerts:
+                await copy_rows(conn, Alert.__tablename__, ALERT_COLUMNS, alerts)
+            rollups.record(transaction_rows, alerts)
+        else:
+            rollups.record(*await insert_scored(conn, transaction_rows, alerts))
+        await rollups.flush(conn)
+
+async def ingest(path: str, file_format: Optional[str], chunk_size: int, dry_run: bool):
+    reader = READERS[file_format or EXTENSIONS[os.path.splitext(path)[1].lower()]]
+    model_dir = os.getenv("MODEL_DIR")
+    ingestor = Ingestor(load_scorer(model_dir) if model_dir else EnsembleScorer())
+    if not dry_run:
+        await init_db()
+
+    started = time.perf_counter()
+    total = flagged = 0
+    pending: Optional[asyncio.Task] = None
+    try:
+        for chunk in chunked(reader(path), chunk_size):
+            # Score the next chunk on a thread while the previous one is being written
+            transaction_rows, alert_rows = await asyncio.to_thread(ingestor.score_chunk, chunk)
+            if pending is not None:
+                await pending
+            if not dry_run:
+                pending = asyncio.create_task(write_chunk(transaction_rows, alert_rows))
+            total += len(transaction_rows)
+            flagged += sum(1 for a in alert_rows if a is not None)
+            elapsed = time.perf_counter() - started
+            print(f"{total:>12,} rows  {total / elapsed:>10,.0f} rows/s  {flagged:>10,} alerts", flush=True)
+        if pending is not None:
+            await pending
+    finally:
+        await engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    print(json.dumps({
+        "rows": total,
+        "alerts": flagged,
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(total / elapsed, 1) if elapsed else 0.0
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description="Score and bulk-load transactions without the HTTP API")
+    parser.add_argument("path", help="Input file (.jsonl, .csv or .parquet)")
+    parser.add_argument("--format", choices=sorted(READERS), help="Override the format implied by the extension")
+    parser.add_argument("--chunk-size", type=int, default=10_000)
+    parser.add_argument("--dry-run", action="store_true", help="Score only; write nothing")
+    args = parser.parse_args()
+    asyncio.run(ingest(args.path, args.format, args.chunk_size, args.dry_run))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import base64
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from database.models import Alert, Transaction
+from database.pagination import decode_cursor, encode_cursor, keyset_page
+
+
+def _cursor(raw: str) -> str:
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def test_cursor_round_trip_converts_id():
+    created_at = datetime(2024, 1, 1)
+    assert decode_cursor(encode_cursor(created_at, 42), int) == (created_at, 42)
+    assert decode_cursor(encode_cursor(created_at, "tx-1")) == (created_at, "tx-1")
+
+
+def test_non_integer_id_for_integer_column_is_rejected():
+    cursor = _cursor("2024-01-01T00:00:00|abc")
+    with pytest.raises(HTTPException) as exc:
+        keyset_page(select(Alert), Alert.created_at, Alert.id, cursor, 10)
+    assert exc.value.status_code == 400
+    # the same id is valid against a string primary key
+    keyset_page(select(Transaction), Transaction.created_at, Transaction.id, cursor, 10)
+
+
+@pytest.mark.parametrize("cursor", ["not-base64!", _cursor("no-separator"), _cursor("yesterday|1")])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor, int)
+    assert exc.value.status_code == 400
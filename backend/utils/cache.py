@@ -0,0 +1,145 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from utils.redis_client import RedisClient
+
+class ResponseCache:
+    """Read-through cache for polled endpoints: in-process L1, Redis L2.
+
+    Concurrent misses for the same key are coalesced so only one caller runs
+    the computation (single-flight). Keys embed a version number that the
+    scoring path bumps; the bump is throttled to ``bump_interval`` seconds and
+    shared through Redis so every worker moves to the new version together.
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[RedisClient] = None,
+        l1_ttl: float = 1.0,
+        l2_ttl: int = 5,
+        bump_interval: float = 1.0,
+        prefix: str = "cache"
+    ):
+        self.redis = redis_client
+        self.l1_ttl = l1_ttl
+        self.l2_ttl = l2_ttl
+        self.bump_interval = bump_interval
+        self.prefix = prefix
+
+        self._l1: Dict[str, Tuple[float, Any]] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._version = 0
+        self._version_checked = 0.0
+        self._last_bump = 0.0
+        self._bump_pending: Optional[asyncio.Task] = None
+
+        self.counters = {"l1_hits": 0, "l2_hits": 0, "misses": 0, "coalesced": 0, "errors": 0}
+
+    @property
+    def _version_key(self) -> str:
+        return f"{self.prefix}:version"
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        version = await self._current_version()
+        full_key = f"{self.prefix}:v{version}:{key}"
+        now = time.monotonic()
+
+        entry = self._l1.get(full_key)
+        if entry is not None and entry[0] > now:
+            self.counters["l1_hits"] += 1
+            return entry[1]
+
+        while (inflight := self._inflight.get(full_key)) is not None:
+            self.counters["coalesced"] += 1
+            try:
+                return await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Only the computing request was cancelled: compute in its place
+                if not inflight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[full_key] = future
+        try:
+            value = await self._load(full_key, compute)
+            self._store_l1(full_key, value, now)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so waiter-less failures do not warn
+            future.exception()
+            raise
+        finally:
+            del self._inflight[full_key]
+            if not future.done():
+                # Cancelled: wake the coalesced waiters so one of them computes instead
+                future.cancel()
+
+    async def _load(self, full_key: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        if self.redis is not None:
+            try:
+                value = await self.redis.get_cache(full_key)
+            except Exception:
+                self.counters["errors"] += 1
+                value = None
+            if value is not None:
+                self.counters["l2_hits"] += 1
+                return value
+
+        self.counters["misses"] += 1
+        value = await compute()
+        if self.redis is not None:
+            try:
+                await self.redis.set_cache(full_key, value, expire=self.l2_ttl)
+            except Exception:
+                self.counters["errors"] += 1
+        return value
+
+    def _store_l1(self, full_key: str, value: Any, now: float):
+        self._l1[full_key] = (now + self.l1_ttl, value)
+        if len(self._l1) > 1024:
+            self._l1 = {k: v for k, v in self._l1.items() if v[0] > now}
+
+    async def _current_version(self) -> int:
+        """Shared version, re-read from Redis at most once per L1 TTL"""
+        now = time.monotonic()
+        if self.redis is not None and now - self._version_checked >= self.l1_ttl:
+            self._version_checked = now
+            try:
+                self._version = max(self._version, int(await self.redis.client.get(self._version_key) or 0))
+            except Exception:
+                self.counters["errors"] += 1
+        return self._version
+
+    def invalidate(self):
+        """Move every cached entry to a new version; at most one bump per ``bump_interval``"""
+        if self._bump_pending is not None:
+            return
+        delay = max(0.0, self._last_bump + self.bump_interval - time.monotonic())
+        self._bump_pending = asyncio.get_running_loop().create_task(self._bump(delay))
+
+    async def _bump(self, delay: float):
+        try:
+            if delay:
+                await asyncio.sleep(delay)
+            self._last_bump = time.monotonic()
+            if self.redis is not None:
+                try:
+                    self._version = max(self._version + 1, int(await self.redis.client.incr(self._version_key)))
+                    return
+                except Exception:
+                    self.counters["errors"] += 1
+            self._version += 1
+        finally:
+            self._bump_pending = None
+
+    def stats(self) -> Dict:
+        lookups = self.counters["l1_hits"] + self.counters["l2_hits"] + self.counters["misses"] + self.counters["coalesced"]
+        hits = lookups - self.counters["misses"]
+        return {
+            **self.counters,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "version": self._version
+        }
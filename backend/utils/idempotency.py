@@ -0,0 +1,290 @@
+import asyncio
+import hashlib
+import json
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.redis_client import RedisClient
+
+# Return the stored entry for KEYS[1], or reserve the key with ARGV[1] for
+# ARGV[2] seconds and return nil. One round-trip, so two workers can never
+# both reserve the same key.
+RESERVE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current then return current end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return false
+"""
+
+# Delete KEYS[1] only while it still holds our reservation ARGV[1]
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a request with a different body"""
+
+class IdempotencyInProgress(Exception):
+    """Another worker holds the key and did not finish within the wait limit"""
+
+def fingerprint(payload: Any) -> str:
+    return hashlib.blake2b(json.dumps(payload, sort_keys=True, default=str).encode(), digest_size=16).hexdigest()
+
+class IdempotencyStore:
+    """Exactly-once execution of requests carrying an idempotency key.
+
+    The first request for a key reserves it in Redis (atomic check-and-set),
+    runs, and stores its JSON result for ``ttl`` seconds; repeats get the
+    stored result back without running again. Concurrent duplicates in the
+    same worker share one in-flight future, so they cost no Redis round-trip
+    at all; duplicates on other workers poll until the owner finishes.
+    Recent results are also kept in a small local LRU so retry storms are
+    served from memory. A failed request releases its reservation so it can
+    be retried. If Redis is unreachable, deduplication falls back to the
+    in-process state only.
+
+    Batches reserve all their keys in one pipeline with ``claim_many`` and
+    settle them with ``complete_many`` or ``release_many``.
+    """
+
+    def __init__(
+        self,
+        redis_client: Optional[RedisClient] = None,
+        ttl: int = 86400,
+        lock_ttl: int = 30,
+        local_size: int = 10000,
+        prefix: str = "idem"
+    ):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.local_size = local_size
+        self.prefix = prefix
+
+        self._local: OrderedDict = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # key -> (Redis key or None when only reserved locally, reservation token, fingerprint)
+        self._claims: Dict[str, Tuple[Optional[str], Optional[str], str]] = {}
+        self._scripts = None
+
+        self.counters = {
+            "executed": 0, "replayed": 0, "coalesced": 0, "waited": 0, "conflicts": 0, "errors": 0
+        }
+
+    async def run(self, key: str, payload: Any, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """Result of ``compute`` for ``key``, computed at most once; also True if it was a replay.
+
+        ``payload`` is the request body; reusing a key with a different body
+        raises ``IdempotencyConflict``.
+        """
+        digest = fingerprint(payload)
+        entry = self._local.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._local.move_to_end(key)
+            return self._replay(key, entry[1], digest), True
+
+        while (inflight := self._inflight.get(key)) is not None:
+            self.counters["coalesced"] += 1
+            try:
+                stored = await asyncio.shield(inflight)
+            except asyncio.CancelledError:
+                # Only the request running the key was cancelled: take over from it
+                if not inflight.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                continue
+            return self._replay(key, stored, digest), True
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            stored, replayed = await self._execute(key, digest, compute)
+            self._remember(key, stored)
+            future.set_result(stored)
+        except Exception as e:
+            future.set_exception(e)
+            # Mark retrieved so waiter-less failures do not warn
+            future.exception()
+            raise
+        finally:
+            del self._inflight[key]
+            if not future.done():
+                # Cancelled: wake the coalesced duplicates so one of them runs instead
+                future.cancel()
+        return (self._replay(key, stored, digest), True) if replayed else (stored['result'], False)
+
+    async def claim_many(self, keys: List[str], payloads: List[Any]) -> List[Optional[Any]]:
+        """Reserve ``keys`` for the caller; returns the stored result for keys that already ran, None for reserved ones.
+
+        Raises ``IdempotencyConflict`` or ``IdempotencyInProgress`` (a key is
+        still running elsewhere) with nothing left reserved. Reserved keys
+        must be settled with ``complete_many`` or ``release_many``.
+        """
+        results: List[Optional[Any]] = [None] * len(keys)
+        claimed = []
+        try:
+            now = time.monotonic()
+            loop = asyncio.get_running_loop()
+            for i, (key, payload) in enumerate(zip(keys, payloads)):
+                digest = fingerprint(payload)
+                entry = self._local.get(key)
+                if entry is not None and entry[0] > now:
+                    results[i] = self._replay(key, entry[1], digest)
+                    continue
+                if key in self._inflight:
+                    raise IdempotencyInProgress(key)
+                self._inflight[key] = loop.create_future()
+                self._claims[key] = (None, None, digest)
+                claimed.append((i, key))
+            if claimed and self.redis is not None:
+                await self._reserve_many(claimed, results)
+        except BaseException:
+            await self.release_many([key for _, key in claimed if key in self._claims])
+            raise
+        return results
+
+    async def _reserve_many(self, claimed: List[Tuple[int, str]], results: List[Optional[Any]]):
+        """Reserve locally claimed keys in Redis; keys that already ran there are replayed into ``results``"""
+        tokens = []
+        try:
+            if self._scripts is None:
+                client = self.redis.client
+                self._scripts = (client.register_script(RESERVE_SCRIPT), client.register_script(RELEASE_SCRIPT))
+            async with self.redis.client.pipeline(transaction=False) as pipe:
+                for _, key in claimed:
+                    tokens.append(json.dumps({"pending": uuid.uuid4().hex, "fingerprint": self._claims[key][2]}))
+                    await self._scripts[0](keys=[f"{self.prefix}:{key}"], args=[tokens[-1], self.lock_ttl], client=pipe)
+                currents = await pipe.execute()
+        except Exception:
+            # Redis unavailable: in-process deduplication only
+            self.counters["errors"] += 1
+            return
+        # Record every Redis reservation first, so an error below releases all of them
+        for (_, key), token, current in zip(claimed, tokens, currents):
+            if current is None:
+                self._claims[key] = (f"{self.prefix}:{key}", token, self._claims[key][2])
+        for (i, key), current in zip(claimed, currents):
+            if current is None:
+                continue
+            digest = self._claims[key][2]
+            stored = json.loads(current)
+            if "result" not in stored:
+                # Held by a request still running on another worker
+                raise IdempotencyInProgress(key)
+            del self._claims[key]
+            self._remember(key, stored)
+            self._inflight.pop(key).set_result(stored)
+            results[i] = self._replay(key, stored, digest)
+
+    async def complete_many(self, keys: List[str], results: List[Any]):
+        """Store the JSON results of keys reserved with ``claim_many``"""
+        pending = []
+        for key, result in zip(keys, results):
+            redis_key, _, digest = self._claims.pop(key)
+            stored = {"fingerprint": digest, "result": result}
+            self._remember(key, stored)
+            self._inflight.pop(key).set_result(stored)
+            if redis_key is not None:
+                pending.append((redis_key, json.dumps(stored)))
+        self.counters["executed"] += len(keys)
+        if pending:
+            try:
+                async with self.redis.client.pipeline(transaction=False) as pipe:
+                    for redis_key, value in pending:
+                        pipe.set(redis_key, value, ex=self.ttl)
+                    await pipe.execute()
+            except Exception:
+                self.counters["errors"] += 1
+
+    async def release_many(self, keys: List[str]):
+        """Give up keys reserved with ``claim_many`` so they can run again"""
+        reserved = []
+        for key in keys:
+            redis_key, token, _ = self._claims.pop(key)
+            if redis_key is not None:
+                reserved.append((redis_key, token))
+            # Waiters on the key take over, as when the owning request is cancelled
+            self._inflight.pop(key).cancel()
+        if reserved:
+            try:
+                async with self.redis.client.pipeline(transaction=False) as pipe:
+                    for redis_key, token in reserved:
+                        await self._scripts[1](keys=[redis_key], args=[token], client=pipe)
+                    await pipe.execute()
+            except Exception:
+                self.counters["errors"] += 1
+
+    async def _execute(self, key: str, digest: str, compute: Callable[[], Awaitable[Any]]) -> Tuple[Dict, bool]:
+        """Reserve ``key`` and compute, or wait for whoever holds it; returns the stored entry"""
+        redis_key = f"{self.prefix}:{key}"
+        token = json.dumps({"pending": uuid.uuid4().hex, "fingerprint": digest})
+        deadline = time.monotonic() + self.lock_ttl
+        delay = 0.005
+        if self.redis is None:
+            return await self._compute(None, None, digest, compute), False
+        while True:
+            try:
+                current = await self._reserve(redis_key, token)
+            except Exception:
+                # Redis unavailable: in-process deduplication only
+                self.counters["errors"] += 1
+                return await self._compute(None, None, digest, compute), False
+            if current is None:
+                return await self._compute(redis_key, token, digest, compute), False
+
+            stored = json.loads(current)
+            if "result" in stored:
+                return stored, True
+            # Held by a request still running on another worker
+            if stored["fingerprint"] != digest:
+                self.counters["conflicts"] += 1
+                raise IdempotencyConflict(key)
+            if time.monotonic() >= deadline:
+                raise IdempotencyInProgress(key)
+            self.counters["waited"] += 1
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.25)
+
+    async def _compute(self, redis_key: Optional[str], token: Optional[str], digest: str, compute) -> Dict:
+        self.counters["executed"] += 1
+        try:
+            result = await compute()
+        except BaseException:
+            if redis_key is not None:
+                try:
+                    await self._scripts[1](keys=[redis_key], args=[token])
+                except Exception:
+                    self.counters["errors"] += 1
+            raise
+        stored = {"fingerprint": digest, "result": result}
+        if redis_key is not None:
+            try:
+                await self.redis.client.set(redis_key, json.dumps(stored), ex=self.ttl)
+            except Exception:
+                self.counters["errors"] += 1
+        return stored
+
+    async def _reserve(self, redis_key: str, token: str) -> Optional[str]:
+        if self._scripts is None:
+            client = self.redis.client
+            self._scripts = (client.register_script(RESERVE_SCRIPT), client.register_script(RELEASE_SCRIPT))
+        return await self._scripts[0](keys=[redis_key], args=[token, self.lock_ttl])
+
+    def _replay(self, key: str, stored: Dict, digest: str) -> Any:
+        if stored["fingerprint"] != digest:
+            self.counters["conflicts"] += 1
+            raise IdempotencyConflict(key)
+        self.counters["replayed"] += 1
+        return stored["result"]
+
+    def _remember(self, key: str, stored: Dict):
+        self._local[key] = (time.monotonic() + self.ttl, stored)
+        if len(self._local) > self.local_size:
+            self._local.popitem(last=False)
+
+    def stats(self) -> Dict:
+        return {**self.counters, "inflight": len(self._inflight), "local": len(self._local)}
@@ -0,0 +1,60 @@
+import os
+from typing import Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+)
+
+# Fine buckets at the low end: most stages take microseconds to a few milliseconds
+LATENCY_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5
+)
+
+SCORE_STAGE_SECONDS = Histogram(
+    "fraud_score_stage_seconds", "Time spent in each stage of scoring a request",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+MODEL_SECONDS = Histogram(
+    "fraud_model_seconds", "Time spent in each ensemble sub-model per call",
+    ["model"], buckets=LATENCY_BUCKETS
+)
+RULE_SECONDS_TOTAL = Counter(
+    "fraud_rule_seconds", "Cumulative time spent evaluating each scoring rule",
+    ["rule"]
+)
+PARTIAL_ENSEMBLES = Counter(
+    "fraud_partial_ensemble", "Scoring batches combined without a sub-model that timed out or failed",
+    ["model"]
+)
+DB_POOL_CHECKOUT_SECONDS = Histogram(
+    "fraud_db_pool_checkout_seconds", "Wait for a pooled DB connection, including opening a new one",
+    buckets=LATENCY_BUCKETS
+)
+REDIS_SECONDS = Histogram(
+    "fraud_redis_seconds", "Redis round-trip time per command or pipeline",
+    ["command"], buckets=LATENCY_BUCKETS
+)
+DECISIONS = Counter(
+    "fraud_decisions_total", "Scored transactions by decision and risk level",
+    ["decision", "risk_level"]
+)
+WS_CONNECTIONS = Gauge(
+    "fraud_websocket_connections", "Open WebSocket connections", multiprocess_mode="livesum"
+)
+WS_QUEUE_DEPTH = Gauge(
+    "fraud_websocket_queued_messages", "Messages waiting in WebSocket send queues", multiprocess_mode="livesum"
+)
+
+# Label children resolved once; labels() on the hot path costs a dict lookup and a lock
+STAGES = {
+    stage: SCORE_STAGE_SECONDS.labels(stage)
+    for stage in ("velocity", "batch", "features", "model", "persist", "broadcast")
+}
+
+def render_metrics() -> Tuple[bytes, str]:
+    """Exposition for /metrics, aggregated across workers when PROMETHEUS_MULTIPROC_DIR is set"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -1,6 +1,19 @@
 import redis.asyncio as redis
 import json
 import os
+import time
+
+from utils.metrics import REDIS_SECONDS
+
+class InstrumentedRedis(redis.Redis):
+    """Redis client that records the round-trip time of every command"""
+
+    async def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_SECONDS.labels(str(args[0]).lower()).observe(time.perf_counter() - started)
 
 class RedisClient:
     def __init__(self):
@@ -8,7 +21,7 @@ class RedisClient:
         self.client = None
     
     async def connect(self):
-        self.client = await redis.from_url(self.redis_url, encoding="utf-8", decode_responses=True)
+        self.client = await InstrumentedRedis.from_url(self.redis_url, encoding="utf-8", decode_responses=True)
     
     async def close(self):
         if self.client:
@@ -17,6 +30,11 @@ class RedisClient:
     async def publish(self, channel: str, message: dict):
         await self.client.publish(channel, json.dumps(message))
     
+    async def subscribe(self, channel: str):
+        pubsub = self.client.pubsub()
+        await pubsub.subscribe(channel)
+        return pubsub
+    
     async def set_cache(self, key: str, value: dict, expire: int = 3600):
         await self.client.setex(key, expire, json.dumps(value))
     
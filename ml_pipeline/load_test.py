@@ -0,0 +1,195 @@
+"""Async load generator and latency benchmark for the scoring API.
+
+Open loop (``--mode open``) fires requests at ``--rps`` regardless of how fast
+the server answers and measures latency from each request's *scheduled* start,
+so a saturated server shows up as queueing delay instead of a lower send rate.
+Closed loop (``--mode closed``) keeps ``--concurrency`` requests in flight.
+
+Examples:
+    python load_test.py --mode open --rps 500 --duration 30
+    python load_test.py --mode closed --concurrency 64 --batch-size 50 --output run.json
+
+Requires httpx (``pip install httpx``).
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+
+import httpx
+
+from generate_frauddata import FraudGenerator
+
+# Same scenario mix as generate_frauddata.main()
+SCENARIO_WEIGHTS = {
+    'normal_transaction': 20,
+    'high_amount_fraud': 8,
+    'velocity_fraud': 10,
+    'high_risk_country': 6,
+    'night_transaction': 4,
+    'device_sharing': 12,
+}
+
+HISTOGRAM_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000]
+
+class Recorder:
+    def __init__(self):
+        self.latencies = []
+        self.errors = Counter()
+        self.transactions = 0
+        self.started = None
+        self.finished = None
+
+    def record(self, latency: float, error: str = None, transactions: int = 1):
+        if error:
+            self.errors[error] += 1
+            return
+        self.latencies.append(latency * 1000)
+        self.transactions += transactions
+
+    def report(self, args) -> dict:
+        latencies = sorted(self.latencies)
+        requests = len(latencies) + sum(self.errors.values())
+        elapsed = (self.finished - self.started) if self.started else 0.0
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] if latencies else None
+
+        histogram = Counter()
+        for value in latencies:
+            bound = next((b for b in HISTOGRAM_BOUNDS_MS if value <= b), None)
+            histogram[f"le_{bound}ms" if bound else f"gt_{HISTOGRAM_BOUNDS_MS[-1]}ms"] += 1
+
+        return {
+            "config": {
+                "url": args.url, "mode": args.mode, "rps": args.rps, "concurrency": args.concurrency,
+                "duration_s": args.duration, "batch_size": args.batch_size
+            },
+            "requests": requests,
+            "succeeded": len(latencies),
+            "error_rate": sum(self.errors.values()) / requests if requests else 0.0,
+            "errors": dict(self.errors),
+            "elapsed_s": elapsed,
+            "throughput_rps": len(latencies) / elapsed if elapsed else 0.0,
+            "throughput_tps": self.transactions / elapsed if elapsed else 0.0,
+            "latency_ms": {
+                "p50": percentile(50), "p95": percentile(95), "p99": percentile(99),
+                "max": latencies[-1] if latencies else None,
+                "mean": sum(latencies) / len(latencies) if latencies else None
+            },
+            "histogram": {k: histogram[k] for k in sorted(histogram, key=_bucket_order)}
+        }
+
+def _bucket_order(name: str) -> float:
+    return float('inf') if name.startswith('gt_') else float(name[3:-2])
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.generator = FraudGenerator()
+        self.scenarios = [getattr(self.generator, name) for name in SCENARIO_WEIGHTS]
+        self.weights = list(SCENARIO_WEIGHTS.values())
+        self.recorder = Recorder()
+        self.measuring = False
+
+        base = args.url.rstrip('/') + "/api/v1/transactions"
+        self.endpoint = f"{base}/score/batch" if args.batch_size > 0 else f"{base}/score"
+
+    def payload(self):
+        if self.args.batch_size > 0:
+            return [self.transaction() for _ in range(self.args.batch_size)]
+        return self.transaction()
+
+    def transaction(self) -> dict:
+        return random.choices(self.scenarios, self.weights)[0]()
+
+    async def send(self, client: httpx.AsyncClient, scheduled: float):
+        payload = self.payload()
+        error = None
+        try:
+            response = await client.post(self.endpoint, json=payload)
+            if response.status_code != 200:
+                error = f"http_{response.status_code}"
+        except httpx.TimeoutException:
+            error = "timeout"
+        except httpx.HTTPError as e:
+            error = type(e).__name__
+        if self.measuring:
+            self.recorder.record(time.perf_counter() - scheduled, error, max(1, self.args.batch_size))
+
+    async def open_loop(self, client: httpx.AsyncClient, duration: float):
+        interval = 1.0 / self.args.rps
+        inflight = set()
+        start = time.perf_counter()
+        n = 0
+        while True:
+            scheduled = start + n * interval
+            if scheduled - start >= duration:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(inflight) >= self.args.max_inflight:
+                # Client-side limit reached: count it rather than silently slowing down
+                if self.measuring:
+                    self.recorder.record(0.0, "client_overflow")
+            else:
+                task = asyncio.create_task(self.send(client, scheduled))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+            n += 1
+        if inflight:
+            await asyncio.wait(inflight)
+
+    async def closed_loop(self, client: httpx.AsyncClient, duration: float):
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                await self.send(client, time.perf_counter())
+
+        await asyncio.gather(*[worker() for _ in range(self.args.concurrency)])
+
+    async def run(self) -> dict:
+        limits = httpx.Limits(max_connections=max(self.args.concurrency, self.args.max_inflight))
+        async with httpx.AsyncClient(limits=limits, timeout=self.args.timeout) as client:
+            phase = self.open_loop if self.args.mode == "open" else self.closed_loop
+            if self.args.warmup > 0:
+                await phase(client, self.args.warmup)
+            self.measuring = True
+            self.recorder.started = time.perf_counter()
+            await phase(client, self.args.duration)
+            self.recorder.finished = time.perf_counter()
+        return self.recorder.report(self.args)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Load test the fraud scoring API")
+    parser.add_argument("--url", default="http://localhost:8000", help="API base URL")
+    parser.add_argument("--mode", choices=["open", "closed"], default="open")
+    parser.add_argument("--rps", type=float, default=100.0, help="Target requests/second (open loop)")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight (closed loop)")
+    parser.add_argument("--max-inflight", type=int, default=1000, help="Open-loop cap on outstanding requests")
+    parser.add_argument("--duration", type=float, default=30.0, help="Measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="Unmeasured seconds before the run")
+    parser.add_argument("--batch-size", type=int, default=0, help="Use /score/batch with this many transactions")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.seed is not None:
+        random.seed(args.seed)
+    report = asyncio.run(LoadTest(args).run())
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()